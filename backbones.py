@@ -1,62 +1,147 @@
-from formula2cnf import load_smtlib
-from dpll import load_dimacs
-from cdcl import CDCL_solver
+from dimacs import open_input, get_file_suffix
+from instance_cache import load_instance, DEFAULT_CACHE_DIR
+from cdcl import CDCL_solver, RESTART_STRATEGIES, DELETION_STRATEGIES, DECISION_STRATEGIES
+from multiprocessing import Pool
 import argparse
+import time
 import sys
 
 parser = argparse.ArgumentParser()
-parser.add_argument('infile', nargs='?', type=argparse.FileType('r', encoding='UTF-8'), default=sys.stdin)
+parser.add_argument('infile', nargs='?', type=open_input, default=sys.stdin)
+parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help="Directory with cached parsed instances")
+parser.add_argument('--no_cache', action='store_true', help="Always parse the input file")
+parser.add_argument('--restart', choices=RESTART_STRATEGIES, default='Luby')
+parser.add_argument('--deletion', choices=DELETION_STRATEGIES, default='active')
+parser.add_argument('--decision', choices=DECISION_STRATEGIES, default='Jeroslow-Wang')
+parser.add_argument('--chunk', type=int, default=8, help="Number of candidate literals tested by one solver run")
+parser.add_argument('--workers', type=int, default=1, help="Number of processes sharing the candidate literals")
 
 
-if __name__ == "__main__":
-    args = parser.parse_args()
+def get_solver_statistics(solver):
+    return {
+        'decisions': solver.decisions_counter,
+        'unit propagation steps': solver.unit_prop_counter,
+        'checked clauses': solver.checked_clauses_counter,
+    }
 
-    file_suffix = args.infile.name.split('.')[-1]
 
-    if file_suffix == 'sat':
-        clauses, variables_mapping = load_smtlib(args.infile)
-    elif file_suffix == 'cnf':
-        clauses = load_dimacs(args.infile)
-    else:
-        raise Exception("Unknown file type")
+def find_backbones(solver, candidates, chunk_size):
+    """Returns backbones among candidate literals and statistics of the filtering phase
+
+    The solver has to be satisfiable and every candidate has to be contained in some of its models.
+    """
+    candidates = set(candidates)
+    backbones = set()
+    statistics = {'solver runs': 0, 'SAT answers': 0, 'UNSAT answers': 0}
+    initial_counters = get_solver_statistics(solver)
+
+    while len(candidates) > 0:
+        chunk = [candidates.pop() for _ in range(min(chunk_size, len(candidates)))]
+        statistics['solver runs'] += 1
+
+        if len(chunk) == 1:
+            assumptions = [-chunk[0]]
+            activation_literal = None
+        else:
+            # clause of negated candidates is switched on by a fresh activation literal
+            activation_literal = solver.variables_number + 1
+            solver.add_clause([-activation_literal] + [-l for l in chunk])
+            assumptions = [activation_literal]
+
+        assignment = solver.solve(assumptions=assumptions)
+
+        if activation_literal is not None:
+            # the clause of negated candidates is never needed again
+            solver.add_clause([-activation_literal])
+
+        if assignment is None:
+            # no model falsifies any literal from the chunk, so all of them are backbones
+            statistics['UNSAT answers'] += 1
+            backbones.update(chunk)
+            for literal in chunk:
+                solver.add_clause([literal])
+        else:
+            # literals which do not hold in the found model cannot be backbones
+            statistics['SAT answers'] += 1
+            assignment = set(assignment)
+            candidates.intersection_update(assignment)
+            candidates.update(l for l in chunk if l in assignment)
+
+    for name, value in get_solver_statistics(solver).items():
+        statistics[name] = value - initial_counters[name]
+    return backbones, statistics
+
+
+def backbones_worker(arguments):
+    clauses, candidates, chunk_size, configuration = arguments
+    start = time.time()
+    solver = CDCL_solver(clauses, *configuration)
+    backbones, statistics = find_backbones(solver, candidates, chunk_size)
+    statistics['CPU time'] = time.time() - start
+    return backbones, statistics
+
+
+def compute_backbones(clauses, configuration=('Luby', 'active', 'Jeroslow-Wang'), chunk_size=8, workers=1):
+    """Returns the set of backbones and a dictionary with statistics of each phase"""
+    statistics = dict()
 
     # first solve formula itself
-    solver = CDCL_solver(clauses, 'Luby', 'active', 'Jeroslow-Wang', assumptions=[])
+    start = time.time()
+    solver = CDCL_solver(clauses, *configuration)
     assignment = solver.solve()
+    statistics['initial solve'] = get_solver_statistics(solver)
+    statistics['initial solve']['CPU time'] = time.time() - start
 
     if assignment is None:
         # if the formula is UNSAT, then no backbones exist
-        possible_backbones = set()
-    else:
-        # otherwise possible backbones are just the literals from the found assignment
-        possible_backbones = set(assignment)
+        return set(), statistics
+
+    # otherwise possible backbones are just the literals from the found assignment
+    possible_backbones = sorted(assignment, key=abs)
+
+    start = time.time()
+    if workers <= 1:
+        # the solver from the first run keeps its learned clauses
+        backbones, statistics['filtering'] = find_backbones(solver, possible_backbones, chunk_size)
+        statistics['filtering']['CPU time'] = time.time() - start
+        return backbones, statistics
+
+    parts = [possible_backbones[i::workers] for i in range(workers)]
+    with Pool(workers) as pool:
+        results = pool.map(backbones_worker, [(clauses, part, chunk_size, configuration) for part in parts if len(part) > 0])
 
     backbones = set()
-    original_clauses = solver.clauses  # we can use original clauses together with learned ones from the first run
-    solver_runs = 1
+    for i, (worker_backbones, worker_statistics) in enumerate(results):
+        backbones.update(worker_backbones)
+        statistics['filtering worker ' + str(i)] = worker_statistics
+    statistics['filtering'] = {'wall time': time.time() - start}
+    return backbones, statistics
 
-    while len(possible_backbones) > 0:
-        solver_runs += 1
-        literal = possible_backbones.pop()
 
-        clauses = original_clauses[:]
-        clauses.append([-literal])
+if __name__ == "__main__":
+    args = parser.parse_args()
 
-        solver = CDCL_solver(clauses, 'Luby', 'active', 'Jeroslow-Wang', assumptions=[])
-        assignment = solver.solve()
+    file_suffix = get_file_suffix(args.infile.name)
 
-        if assignment is not None:
-            # '+literal' cannot be a backbone
-            # we can reduce 'possible_backbones' because they must be contained again in found assignment
-            possible_backbones = possible_backbones.intersection(set(assignment)).difference(backbones)
+    if file_suffix not in ['sat', 'cnf']:
+        raise Exception("Unknown file type")
+    clauses, variables_mapping, _ = load_instance(args.infile, file_suffix, None if args.no_cache else args.cache_dir)
 
-        else:
-            # there exists no model where '-literal' holds, so 'literal' is a backbone
-            backbones.add(literal)
+    backbones, statistics = compute_backbones(clauses, (args.restart, args.deletion, args.decision),
+                                              max(1, args.chunk), args.workers)
 
     if len(backbones) == 0:
         print('No backbones exist')
     else:
         print(str(len(backbones)), 'backbones:')
-        print(backbones)
+        print(sorted(backbones, key=abs))
+
+    solver_runs = 1 + sum(phase.get('solver runs', 0) for phase in statistics.values())
     print('Number of solver runs:', solver_runs)
+    print()
+    for phase, phase_statistics in statistics.items():
+        print(phase + ':')
+        for name, value in phase_statistics.items():
+            if isinstance(value, float):
+                value = "{:.2f}".format(value)
+            print('   ', name + ':', value)
@@ -0,0 +1,149 @@
+from dimacs import open_input, get_file_suffix
+from instance_cache import load_instance, DEFAULT_CACHE_DIR
+from cdcl import CDCL_solver, RESTART_STRATEGIES, DELETION_STRATEGIES, DECISION_STRATEGIES, decode_assignment
+import dpll
+import dpll_watched
+from multiprocessing import Pool
+import argparse
+import signal
+import random
+import glob
+import json
+import time
+import sys
+import os
+
+parser = argparse.ArgumentParser()
+parser.add_argument('paths', nargs='+', help="Instance files, directories or glob patterns")
+parser.add_argument('--output', type=argparse.FileType('w', encoding='UTF-8'), default=sys.stdout,
+                    help="File for JSON lines with results")
+parser.add_argument('--solver', choices=['cdcl', 'dpll', 'dpll_watched'], default='cdcl')
+parser.add_argument('--workers', type=int, default=1, help="Number of processes solving the instances")
+parser.add_argument('--timeout', type=float, default=0, help="Time limit per instance in seconds (0 for no limit)")
+parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help="Directory with cached parsed instances")
+parser.add_argument('--no_cache', action='store_true', help="Always parse the input files")
+parser.add_argument('--restart', choices=RESTART_STRATEGIES, default=None)
+parser.add_argument('--deletion', choices=DELETION_STRATEGIES, default=None)
+parser.add_argument('--decision', choices=DECISION_STRATEGIES, default='random')
+parser.add_argument('--partial_restart', action='store_true', help="Keep the part of the trail which would be assigned again")
+parser.add_argument('--phase_saving', action='store_true', help="Decide variables with their last assigned polarity")
+parser.add_argument('--decision_heuristics', choices=dpll.DECISION_HEURISTICS, default=None,
+                    help="Branching heuristics of dpll")
+
+INSTANCE_SUFFIXES = ['cnf', 'sat']
+
+
+class InstanceTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise InstanceTimeout()
+
+
+def init_worker():
+    signal.signal(signal.SIGALRM, raise_timeout)
+
+
+def find_instances(paths):
+    """Returns instance files given by file names, directories and glob patterns, each file only once"""
+    file_names = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_names.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                     if get_file_suffix(name) in INSTANCE_SUFFIXES and os.path.isfile(os.path.join(path, name))))
+        elif os.path.isfile(path):
+            file_names.append(path)
+        else:
+            file_names.extend(sorted(name for name in glob.glob(path) if os.path.isfile(name)))
+    return list(dict.fromkeys(file_names))
+
+
+def run_solver(clauses, solver_name, options, statistics):
+    """Returns a satisfying assignment or None, search counters are stored in 'statistics' even on timeout"""
+    if solver_name == 'cdcl':
+        # pool processes are reused, so random decisions must not depend on previously solved instances
+        random.seed(42)
+        solver = CDCL_solver(clauses, options['restart'], options['deletion'], options['decision'],
+                             partial_restart=options['partial_restart'], phase_saving=options.get('phase_saving', False))
+        try:
+            return solver.solve()
+        finally:
+            statistics['decisions'] = solver.decisions_counter
+            statistics['unit propagation steps'] = solver.unit_prop_counter
+            statistics['checked clauses'] = solver.checked_clauses_counter
+
+    module = dpll if solver_name == 'dpll' else dpll_watched
+    module.unit_prop_counter = 0
+    module.decisions_counter = 0
+    module.checked_clauses_counter = 0
+    try:
+        if solver_name == 'dpll':
+            adjacency_list = dpll.get_adjacency_list(clauses)
+            unit_literals = set([clause[0] for clause in clauses if len(clause) == 1])
+            return dpll.dpll(clauses, adjacency_list, [False for _ in clauses], [], [0 for _ in clauses],
+                             literals_to_satisfy=unit_literals, heuristics=options['decision_heuristics'])
+        clauses, watched_literals, literals_to_satisfy = dpll_watched.get_watched_literals(clauses)
+        return dpll_watched.dpll_watched(clauses, watched_literals, [], literals_to_satisfy)
+    finally:
+        statistics['decisions'] = module.decisions_counter
+        statistics['unit propagation steps'] = module.unit_prop_counter
+        statistics['checked clauses'] = module.checked_clauses_counter
+
+
+def solve_instance(arguments):
+    """Solves one instance in a pool process, returns the result as a dictionary"""
+    file_name, solver_name, options, timeout, cache_dir = arguments
+    result = {'file': file_name, 'solver': solver_name, 'answer': None, 'model': None}
+    statistics = {'decisions': 0, 'unit propagation steps': 0, 'checked clauses': 0}
+    start = time.time()
+    cpu_start = time.process_time()
+    try:
+        try:
+            if timeout > 0:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            file_suffix = get_file_suffix(file_name)
+            if file_suffix not in INSTANCE_SUFFIXES:
+                raise Exception("Unknown file type")
+            with open_input(file_name) as input:
+                clauses, variables_mapping, _ = load_instance(input, file_suffix, cache_dir)
+            assignment = run_solver(clauses, solver_name, options, statistics)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if assignment is None:
+            result['answer'] = 'UNSAT'
+        else:
+            result['answer'] = 'SAT'
+            result['model'] = decode_assignment(assignment, variables_mapping)
+    except InstanceTimeout:
+        result['answer'] = 'TIMEOUT'
+    except Exception as e:
+        # one broken instance must not stop the whole batch
+        result['answer'] = 'ERROR'
+        result['error'] = repr(e)
+
+    result['CPU time'] = time.process_time() - cpu_start
+    result['wall time'] = time.time() - start
+    result.update(statistics)
+    return result
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    file_names = find_instances(args.paths)
+    options = {
+        'restart': args.restart,
+        'deletion': args.deletion,
+        'decision': args.decision,
+        'partial_restart': args.partial_restart,
+        'phase_saving': args.phase_saving,
+        'decision_heuristics': args.decision_heuristics,
+    }
+    cache_dir = None if args.no_cache else args.cache_dir
+    tasks = [(file_name, args.solver, options, args.timeout, cache_dir) for file_name in file_names]
+
+    # pool processes are reused, so modules are imported only once per worker
+    with Pool(max(1, args.workers), initializer=init_worker) as pool:
+        for result in pool.imap_unordered(solve_instance, tasks):
+            print(json.dumps(result), file=args.output, flush=True)
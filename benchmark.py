@@ -0,0 +1,241 @@
+from batch import solve_instance, init_worker
+from dpll import DECISION_HEURISTICS
+from cdcl import RESTART_STRATEGIES, DELETION_STRATEGIES, DECISION_STRATEGIES
+from multiprocessing import Pool
+from itertools import product
+import argparse
+import statistics
+import subprocess
+import platform
+import datetime
+import random
+import json
+import glob
+import math
+import sys
+import os
+import re
+
+FORMAT_VERSION = 1
+METRICS = ['CPU time', 'decisions', 'unit propagation steps', 'checked clauses']
+INSTANCE_NAME = re.compile(r'^([a-z]+)(\d+)-')     # family and number of variables, e.g. 'uuf' and 75
+
+parser = argparse.ArgumentParser()
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+run_parser = subparsers.add_parser('run', help="Run the benchmark and write results to a JSON file")
+run_parser.add_argument('--output', default='benchmark.json', help="File with results")
+run_parser.add_argument('--problems', default='problems', help="Directory with uf*/uuf* instances")
+run_parser.add_argument('--generate', type=int, nargs='*', default=[], help="Sizes of generated random 3-SAT instances")
+run_parser.add_argument('--generated_count', type=int, default=3, help="Number of generated instances of each size")
+run_parser.add_argument('--generated_dir', default=os.path.join('problems', 'generated'))
+run_parser.add_argument('--max_variables', type=int, default=None, help="Skip instances with more variables")
+run_parser.add_argument('--solvers', nargs='*', default=None, help="Run only solvers whose names contain one of these")
+run_parser.add_argument('--repeats', type=int, default=3, help="Number of runs of each solver on each instance")
+run_parser.add_argument('--timeout', type=float, default=60, help="Time limit of a single run in seconds")
+run_parser.add_argument('--workers', type=int, default=1, help="Number of processes running the solvers")
+
+compare_parser = subparsers.add_parser('compare', help="Compare results with a baseline and report regressions")
+compare_parser.add_argument('baseline')
+compare_parser.add_argument('current')
+compare_parser.add_argument('--threshold', type=float, default=0.1, help="Relative change reported as a regression")
+compare_parser.add_argument('--min_time', type=float, default=0.05, help="Smaller time differences are ignored (seconds)")
+
+
+def get_solver_configurations():
+    """Returns dictionary from solver names to (solver, options) used by the batch runner
+
+    cdcl is run in every combination of restarts, deletion, decision heuristics, partial restarts and phase saving.
+    """
+    configurations = dict()
+    dpll_options = {'decision_heuristics': None}
+    configurations['dpll'] = ('dpll', dpll_options)
+    for heuristics in DECISION_HEURISTICS:
+        configurations['dpll ' + heuristics] = ('dpll', dict(dpll_options, decision_heuristics=heuristics))
+    configurations['dpll_watched'] = ('dpll_watched', dpll_options)
+
+    # names without flags are kept from the first benchmark, so old results stay comparable
+    for restart, deletion, decision, partial_restart, phase_saving in product(
+            [None] + RESTART_STRATEGIES, [None] + DELETION_STRATEGIES, DECISION_STRATEGIES, [False, True], [False, True]):
+        if restart is None and partial_restart:
+            continue    # without restarts it is the same configuration as without partial restarts
+        name = ' '.join(['cdcl', restart or 'no restart', deletion or 'no deletion', decision])
+        if partial_restart:
+            name += ' partial restart'
+        if phase_saving:
+            name += ' phase saving'
+        configurations[name] = ('cdcl', {'restart': restart, 'deletion': deletion, 'decision': decision,
+                                         'partial_restart': partial_restart, 'phase_saving': phase_saving})
+    return configurations
+
+
+def generate_instance(path, variables_number, seed, ratio=4.26):
+    """Writes a random 3-SAT formula with the clause/variable ratio of the satisfiability threshold"""
+    generator = random.Random(seed)
+    clauses_number = round(ratio * variables_number)
+    with open(path, 'w', encoding='UTF-8') as f:
+        print('c random 3-SAT, seed', seed, file=f)
+        print('p cnf', variables_number, clauses_number, file=f)
+        for _ in range(clauses_number):
+            variables = generator.sample(range(1, variables_number + 1), 3)
+            print(*[v if generator.random() < 0.5 else -v for v in variables], 0, file=f)
+
+
+def get_instances(args):
+    """Returns sorted list of (file name, family, number of variables) of the benchmark instances"""
+    file_names = glob.glob(os.path.join(args.problems, 'uf*.cnf')) + glob.glob(os.path.join(args.problems, 'uuf*.cnf'))
+    if len(args.generate) > 0:
+        os.makedirs(args.generated_dir, exist_ok=True)
+    for variables_number in args.generate:
+        for i in range(args.generated_count):
+            path = os.path.join(args.generated_dir, 'rand{}-{:02d}.cnf'.format(variables_number, i + 1))
+            if not os.path.isfile(path):
+                generate_instance(path, variables_number, seed=1000 * variables_number + i)
+            file_names.append(path)
+
+    instances = []
+    for file_name in file_names:
+        match = INSTANCE_NAME.match(os.path.basename(file_name))
+        if match is None:
+            continue
+        variables_number = int(match.group(2))
+        if args.max_variables is None or variables_number <= args.max_variables:
+            instances.append((file_name, match.group(1), variables_number))
+    return sorted(instances, key=lambda instance: (instance[2], instance[1], instance[0]))
+
+
+def get_revision():
+    """Returns the git commit of the solvers, None outside of a git repository"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(args):
+    configurations = get_solver_configurations()
+    if args.solvers is not None:
+        configurations = {name: configuration for name, configuration in configurations.items()
+                          if any(pattern in name for pattern in args.solvers)}
+    instances = get_instances(args)
+
+    tasks = []
+    for name, (solver, options) in configurations.items():
+        for file_name, _, _ in instances:
+            for _ in range(args.repeats):
+                tasks.append((name, (file_name, solver, options, args.timeout, None)))
+
+    runs = dict()
+    with Pool(max(1, args.workers), initializer=init_worker) as pool:
+        results = pool.imap(solve_instance, [task for _, task in tasks])
+        for i, ((name, task), result) in enumerate(zip(tasks, results)):
+            runs.setdefault((name, task[0]), []).append(result)
+            print('\r{}/{} runs'.format(i + 1, len(tasks)), end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    results = dict()
+    for name in configurations:
+        results[name] = dict()
+        for file_name, family, variables_number in instances:
+            instance_runs = runs[(name, file_name)]
+            answers = set(run['answer'] for run in instance_runs if run['answer'] != 'TIMEOUT')
+            if len(answers) == 0:
+                answers.add('TIMEOUT')
+            entry = {
+                'family': family,
+                'variables': variables_number,
+                'answer': answers.pop() if len(answers) == 1 else 'INCONSISTENT',
+                'timeouts': sum(1 for run in instance_runs if run['answer'] == 'TIMEOUT'),
+            }
+            for metric in METRICS:
+                entry[metric] = statistics.median(run[metric] for run in instance_runs)
+            results[name][file_name] = entry
+
+    return {
+        'format version': FORMAT_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': get_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeats': args.repeats,
+        'timeout': args.timeout,
+        'results': results,
+    }
+
+
+def load_results(file_name):
+    with open(file_name, encoding='UTF-8') as f:
+        data = json.load(f)
+    if data.get('format version') != FORMAT_VERSION:
+        raise Exception("Unsupported format version of " + file_name)
+    return data
+
+
+def compare_results(baseline, current, threshold=0.1, min_time=0.05):
+    """Returns lists of regressions and improvements as (solver, instance, metric, old value, new value)"""
+    regressions = []
+    improvements = []
+    for name, instances in current['results'].items():
+        for file_name, entry in instances.items():
+            old_entry = baseline['results'].get(name, dict()).get(file_name)
+            if old_entry is None:
+                continue
+            if entry['answer'] != old_entry['answer'] and 'TIMEOUT' not in [entry['answer'], old_entry['answer']]:
+                regressions.append((name, file_name, 'answer', old_entry['answer'], entry['answer']))
+            for metric in ['CPU time', 'checked clauses']:
+                old, new = old_entry[metric], entry[metric]
+                if metric == 'CPU time' and abs(new - old) < min_time:
+                    continue
+                if new > old * (1 + threshold):
+                    regressions.append((name, file_name, metric, old, new))
+                elif new < old * (1 - threshold):
+                    improvements.append((name, file_name, metric, old, new))
+    return regressions, improvements
+
+
+def get_time_ratios(baseline, current):
+    """Returns geometric means of CPU time ratios (current / baseline) of each solver"""
+    ratios = dict()
+    for name, instances in current['results'].items():
+        logs = []
+        for file_name, entry in instances.items():
+            old_entry = baseline['results'].get(name, dict()).get(file_name)
+            if old_entry is not None and old_entry['CPU time'] > 0 and entry['CPU time'] > 0:
+                logs.append(math.log(entry['CPU time'] / old_entry['CPU time']))
+        if len(logs) > 0:
+            ratios[name] = math.exp(sum(logs) / len(logs))
+    return ratios
+
+
+def format_value(value):
+    return "{:.2f}".format(value) if isinstance(value, float) else str(value)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        data = run_benchmark(args)
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            json.dump(data, f, indent=1)
+        print('results written to', args.output)
+
+    elif args.command == 'compare':
+        baseline = load_results(args.baseline)
+        current = load_results(args.current)
+        print('baseline revision:', baseline['revision'])
+        print('current revision:', current['revision'])
+        regressions, improvements = compare_results(baseline, current, args.threshold, args.min_time)
+
+        print()
+        print('CPU time ratios (current / baseline):')
+        for name, ratio in sorted(get_time_ratios(baseline, current).items(), key=lambda item: item[1]):
+            print('   ', name + ':', "{:.2f}".format(ratio))
+        for title, changes in [('regressions', regressions), ('improvements', improvements)]:
+            print()
+            print(title + ':', len(changes))
+            for name, file_name, metric, old, new in changes:
+                print('   ', name, file_name, metric + ':', format_value(old), '->', format_value(new))
+        if len(regressions) > 0:
+            sys.exit(1)
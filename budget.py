@@ -0,0 +1,51 @@
+import time
+
+UNKNOWN = 'UNKNOWN'             # answer of a search stopped by its budget or by an interrupt
+BUDGET_CHECK_INTERVAL = 256     # number of propagation steps between checks of the clock and the interrupt flag
+
+
+def add_budget_arguments(parser):
+    """Adds search limits to the command line parser of a solver"""
+    parser.add_argument('--conflict_budget', type=int, default=None, help="Stop with UNKNOWN after N conflicts")
+    parser.add_argument('--propagation_budget', type=int, default=None,
+                        help="Stop with UNKNOWN after N unit propagation steps")
+    parser.add_argument('--time_budget', type=float, default=None, help="Stop with UNKNOWN after N seconds")
+
+
+class Budget:
+    """Conflict, propagation and time limits of one search call, the search can also be interrupted
+
+    Limits are relative to the start of the search. The solver compares its propagation counter with
+    'next_check' in the propagation loop, the clock and the interrupt flag are read only when it is reached,
+    i.e. every BUDGET_CHECK_INTERVAL steps. interrupt() only sets a flag, so it can be called from another
+    thread or a signal handler, the interrupt stops the running search or the next one.
+    """
+    def __init__(self, conflicts=None, propagations=None, time_limit=None):
+        self.conflicts = conflicts
+        self.propagations = propagations
+        self.time_limit = time_limit
+        self.interrupted = False
+        self.conflict_limit = float('inf')
+        self.propagation_limit = float('inf')
+        self.deadline = float('inf')
+        self.next_check = 0
+        self.resume_state = None    # search state of a stopped dpll call, it continues from it
+
+    def interrupt(self):
+        self.interrupted = True
+
+    def start(self, conflicts_counter, propagations_counter):
+        """Sets limits of a search starting with the given counter values"""
+        self.conflict_limit = float('inf') if self.conflicts is None else conflicts_counter + self.conflicts
+        self.propagation_limit = float('inf') if self.propagations is None else propagations_counter + self.propagations
+        self.deadline = float('inf') if self.time_limit is None else time.perf_counter() + self.time_limit
+        self.next_check = propagations_counter
+
+    def is_exhausted(self, propagations_counter):
+        """Returns True if the search has to stop, otherwise plans the next check"""
+        if self.interrupted or propagations_counter >= self.propagation_limit or time.perf_counter() >= self.deadline:
+            # the interrupt is consumed by the stopped search
+            self.interrupted = False
+            return True
+        self.next_check = min(self.propagation_limit, propagations_counter + BUDGET_CHECK_INTERVAL)
+        return False
@@ -3,36 +3,169 @@ import argparse
 import time
 import math
 import random
-
-from formula2cnf import load_smtlib
-from dpll import load_dimacs
+import signal
+import queue
+import multiprocessing
+
+from dimacs import open_input, get_file_suffix
+from instance_cache import load_instance, DEFAULT_CACHE_DIR
+from preprocessing import Preprocessor, add_preprocessing_arguments
+from clause_exchange import ClauseExchange
+from instrumentation import Instrumentation, add_instrumentation_arguments, print_progress, write_statistics
+from proof import ProofWriter, add_proof_arguments
+from budget import Budget, UNKNOWN, add_budget_arguments
+
+RESTART_STRATEGIES = ['geometric', 'Luby', 'glucose']
+DELETION_STRATEGIES = ['short', 'active', 'LBD', 'tiered']
+DECISION_STRATEGIES = ['random', 'most_common', 'Jeroslow-Wang', 'VSIDS']
 
 parser = argparse.ArgumentParser()
-parser.add_argument('infile', nargs='?', type=argparse.FileType('r', encoding='UTF-8'), default=sys.stdin)
-parser.add_argument('--restart', choices=['geometric', 'Luby'], default=None)
-parser.add_argument('--deletion', choices=['short', 'active', 'LBD'], default=None)
-parser.add_argument('--decision', choices=['random', 'most_common', 'Jeroslow-Wang', 'VSIDS'], default='random')
+parser.add_argument('infile', nargs='?', type=open_input, default=sys.stdin)
+parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help="Directory with cached parsed instances")
+parser.add_argument('--no_cache', action='store_true', help="Always parse the input file")
+parser.add_argument('--restart', choices=RESTART_STRATEGIES, default=None)
+parser.add_argument('--deletion', choices=DELETION_STRATEGIES, default=None)
+parser.add_argument('--decision', choices=DECISION_STRATEGIES, default='random')
+parser.add_argument('--partial_restart', action='store_true', help="Keep the part of the trail which would be assigned again")
+parser.add_argument('--phase_saving', action='store_true', help="Decide variables with their last assigned polarity")
+parser.add_argument('--portfolio', type=int, default=0, help="Number of processes solving the formula with different configurations")
+parser.add_argument('--no_sharing', action='store_true', help="Portfolio workers do not exchange learned clauses")
+add_preprocessing_arguments(parser)
+add_instrumentation_arguments(parser)
+add_proof_arguments(parser)
+add_budget_arguments(parser)
+parser.add_argument('--models', type=int, default=None, help="Enumerate models, at most N of them (0 for all)")
+parser.add_argument('--shrink_models', action='store_true', help="Shorten enumerated models to cubes of needed literals")
 
 random.seed(42)
 
+# tiers of learned clauses used by the 'tiered' deletion policy
+CORE = 'core'       # glue clauses which are kept forever
+TIER2 = 'tier2'     # clauses kept while they are used in conflict analysis
+LOCAL = 'local'     # clauses from which the less active half is deleted periodically
+
+# configurations (restart, deletion, decision, partial restart, phase saving) of portfolio workers, used cyclically
+PORTFOLIO_CONFIGURATIONS = [
+    ('Luby', 'tiered', 'VSIDS', True, False),
+    ('glucose', 'tiered', 'VSIDS', False, True),
+    ('Luby', 'active', 'Jeroslow-Wang', True, False),
+    ('geometric', 'tiered', 'most_common', False, False),
+    ('Luby', 'LBD', 'random', True, False),
+    ('glucose', 'LBD', 'VSIDS', False, False),
+    ('Luby', 'short', 'most_common', False, True),
+    (None, None, 'VSIDS', False, False),
+]
+
+
+class VariableHeap:
+    """Binary max-heap of variables ordered by their activity"""
+    def __init__(self, activity):
+        self.activity = activity            # shared with DecisionHeuristics, indexed by variable
+        self.heap = []
+        self.indices = [-1] * len(activity)  # position of each variable in the heap (-1 if absent)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, var):
+        return self.indices[var] >= 0
+
+    def insert(self, var):
+        if self.indices[var] >= 0:
+            return
+        self.indices[var] = len(self.heap)
+        self.heap.append(var)
+        self.sift_up(len(self.heap) - 1)
+
+    def increase(self, var):
+        """Restores the heap order after the activity of 'var' has grown"""
+        if self.indices[var] >= 0:
+            self.sift_up(self.indices[var])
+
+    def pop(self):
+        top = self.heap[0]
+        last = self.heap.pop()
+        self.indices[top] = -1
+        if len(self.heap) > 0:
+            self.heap[0] = last
+            self.indices[last] = 0
+            self.sift_down(0)
+        return top
+
+    def sift_up(self, i):
+        heap, indices, activity = self.heap, self.indices, self.activity
+        var = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if activity[heap[parent]] >= activity[var]:
+                break
+            heap[i] = heap[parent]
+            indices[heap[i]] = i
+            i = parent
+        heap[i] = var
+        indices[var] = i
+
+    def sift_down(self, i):
+        heap, indices, activity = self.heap, self.indices, self.activity
+        var = heap[i]
+        size = len(heap)
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and activity[heap[child + 1]] > activity[heap[child]]:
+                child += 1
+            if activity[heap[child]] <= activity[var]:
+                break
+            heap[i] = heap[child]
+            indices[heap[i]] = i
+            i = child
+        heap[i] = var
+        indices[var] = i
+
 
 class DecisionHeuristics:
-    def __init__(self, heuristics_type, clauses, assumptions):
+    def __init__(self, heuristics_type, clauses):
         self.type = heuristics_type
-        self.assumptions = assumptions
         all_literals = set()
         for clause in clauses:
             for l in clause:
                 all_literals.add(l)
                 all_literals.add(-l)
         self.all_literals = list(all_literals)
+        self.variables = set(abs(l) for l in all_literals)
         self.literal_counters = dict()
 
+        if self.type == 'VSIDS':
+            variables_number = max((abs(l) for l in self.all_literals), default=0)
+            self.activity = [0.0] * (variables_number + 1)
+            self.polarity = [False] * (variables_number + 1)     # True if the positive literal is preferred
+            self.var_increment = 1.0
+            self.var_decay = 0.95
+            self.heap = VariableHeap(self.activity)
+
+            # initial activities and polarities are given by occurrences in the original clauses
+            occurrences = dict()
+            for clause in clauses:
+                for lit in clause:
+                    self.activity[abs(lit)] += 1
+                    occurrences[lit] = occurrences.get(lit, 0) + 1
+            for lit in self.all_literals:
+                if lit > 0:
+                    self.polarity[lit] = occurrences.get(lit, 0) >= occurrences.get(-lit, 0)
+
     def reinitialize(self, clauses):
+        if self.type == 'VSIDS':
+            # activities survive restarts, only the heap has to contain all variables again
+            for lit in self.all_literals:
+                if lit > 0:
+                    self.heap.insert(lit)
+            return
+
         for l in self.all_literals:
             self.literal_counters[l] = 0
 
-        if self.type in ['VSIDS', 'most_common', 'Jeroslow-Wang']:
+        if self.type in ['most_common', 'Jeroslow-Wang']:
             for clause in clauses:
                 for lit in clause:
                     if self.type == 'Jeroslow-Wang':
@@ -40,34 +173,87 @@ class DecisionHeuristics:
                     else:
                         self.literal_counters[lit] += 1
 
+    def add_variable(self, var):
+        """Registers a variable which did not occur in any clause so far"""
+        if var in self.variables:
+            return
+        self.variables.add(var)
+        self.all_literals.append(var)
+        self.all_literals.append(-var)
+        self.literal_counters[var] = 0
+        self.literal_counters[-var] = 0
+
+        if self.type == 'VSIDS':
+            while len(self.activity) <= var:
+                self.activity.append(0.0)
+                self.polarity.append(False)
+                self.heap.indices.append(-1)
+            self.heap.insert(var)
+
+    def add_clause(self, clause):
+        """Updates the counters with a new original clause"""
+        for lit in clause:
+            self.add_variable(abs(lit))
+
+        if self.type == 'VSIDS':
+            for lit in clause:
+                self.activity[abs(lit)] += 1
+                self.heap.increase(abs(lit))
+        elif self.type in ['most_common', 'Jeroslow-Wang']:
+            self.process_new_clause(clause)
+
+    def bump_variable(self, var):
+        if self.type != 'VSIDS':
+            return
+        self.activity[var] += self.var_increment
+        if self.activity[var] > 1e100:
+            # rescaling keeps the heap order because all activities are multiplied by the same factor
+            for v in range(len(self.activity)):
+                self.activity[v] *= 1e-100
+            self.var_increment *= 1e-100
+        self.heap.increase(var)
+
+    def unassign_variable(self, var):
+        if self.type == 'VSIDS':
+            self.heap.insert(var)
+
     def process_new_clause(self, clause):
         if self.type == 'Jeroslow-Wang':
             for lit in clause:
                 self.literal_counters[lit] += 2 ** -len(clause)
-        elif self.type in ['most_common', 'VSIDS']:
+        elif self.type == 'most_common':
             for lit in clause:
                 self.literal_counters[lit] += 1
+        elif self.type == 'VSIDS':
+            # decaying all activities is done lazily by growing the increment
+            self.var_increment /= self.var_decay
 
+    def get_score(self, literal):
         if self.type == 'VSIDS':
-            for lit in self.all_literals:
-                self.literal_counters[lit] /= 2
+            return self.activity[abs(literal)]
+        return self.literal_counters[literal]
 
-    def get_literal(self, current_assignment):
-        if len(current_assignment) == len(self.all_literals) / 2:
+    def get_best_score(self, values):
+        """Returns the score of the literal which would be decided next (None for random decisions)"""
+        if self.type == 'random':
             return None
+        if self.type == 'VSIDS':
+            while len(self.heap) > 0 and values[self.heap.heap[0]] != 0:
+                self.heap.pop()
+            return self.activity[self.heap.heap[0]] if len(self.heap) > 0 else None
+        return max((counter for l, counter in self.literal_counters.items() if values[abs(l)] == 0), default=None)
 
-        # process assumptions
-        assumption_literal_found = False
-        while len(self.assumptions) > 0:
-            literal = self.assumptions.pop()
-            if literal in current_assignment or -literal in current_assignment:
-                continue
-            else:
-                assumption_literal_found = True
-
-        if assumption_literal_found:
-            return literal
+    def get_literal(self, current_assignment, values):
+        if len(current_assignment) == len(self.all_literals) / 2:
+            return None
 
+        if self.type == 'VSIDS':
+            # assigned variables are removed lazily, backtracking puts them back
+            while len(self.heap) > 0:
+                var = self.heap.pop()
+                if values[var] == 0:
+                    return var if self.polarity[var] else -var
+            return None
 
         unassigned_literals = self.all_literals[:]
         for l in current_assignment:
@@ -87,66 +273,144 @@ class DecisionHeuristics:
 
 
 class Luby:
+    """Luby sequence 1, 1, 2, 1, 1, 2, 4, ... generated in constant memory (reluctant doubling)"""
     def __init__(self):
         self.constant = 100
-        self.history = []
-        self.i = -1
-        self.get_next()     # auxiliary step for skipping the first element (1/2)
+        self.u = 1
+        self.v = 1
 
     def get_next(self):
-        self.i += 1
-
-        k = math.log2(self.i + 1)
-        if k.is_integer():
-            self.history.append(int(2**(k-1)))
+        value = self.v
+        if self.u & -self.u == self.v:
+            self.u += 1
+            self.v = 1
         else:
-            k = int(math.log2(self.i)) + 1
-            self.history.append(
-                self.history[self.i - 2**(k-1) + 1]
-            )
-        return self.history[-1]
+            self.v *= 2
+        return value
+
+
+class GlucoseRestarts:
+    """Dynamic restarts comparing a fast and a slow moving average of LBD of learned clauses
+
+    A restart is due when recent clauses are worse than the long term average. It is blocked when
+    the trail is much longer than usual at a conflict, because the solver may be close to a model.
+    The averages are exponential, their weight of the first values is raised so they start unbiased.
+    """
+    def __init__(self, margin=1.25, blocking=1.4, minimum_conflicts=50, blocking_start=10000):
+        self.margin = margin                        # restart if fast LBD average > margin * slow one
+        self.blocking = blocking                    # block if trail size > blocking * its average
+        self.minimum_conflicts = minimum_conflicts  # conflicts between restarts
+        self.blocking_start = blocking_start        # conflicts before the trail average is reliable
+        self.fast_lbd = 0.0
+        self.slow_lbd = 0.0
+        self.trail_size = 0.0
+        self.conflicts = 0
+        self.conflicts_since_restart = 0
+        self.blocked_restarts_counter = 0
+
+    @staticmethod
+    def update(average, value, alpha, count):
+        alpha = max(alpha, 1 / count)
+        return average + alpha * (value - average)
+
+    def on_conflict(self, lbd, trail_size):
+        """Updates the averages, returns True if the solver should restart"""
+        self.conflicts += 1
+        self.conflicts_since_restart += 1
+        self.fast_lbd = self.update(self.fast_lbd, lbd, 1 / 32, self.conflicts)
+        self.slow_lbd = self.update(self.slow_lbd, lbd, 1 / 4096, self.conflicts)
+        self.trail_size = self.update(self.trail_size, trail_size, 1 / 4096, self.conflicts)
+
+        if self.conflicts > self.blocking_start and trail_size > self.blocking * self.trail_size:
+            if self.conflicts_since_restart >= self.minimum_conflicts:
+                self.blocked_restarts_counter += 1
+            self.conflicts_since_restart = 0
+            return False
+        return self.conflicts_since_restart >= self.minimum_conflicts and self.fast_lbd > self.margin * self.slow_lbd
+
+    def on_restart(self):
+        self.conflicts_since_restart = 0
 
 
 class CDCL_solver:
-    def __init__(self, clauses, restart, deletion, decision, assumptions):
+    def __init__(self, clauses, restart, deletion, decision, assumptions=(), partial_restart=False, clause_exchange=None,
+                 phase_saving=False, proof=None):
         self.unit_prop_counter = 0
         self.decisions_counter = 0
         self.checked_clauses_counter = 0
 
         self.deletion = deletion
         self.restarts_counter = 0
-        self.original_clauses_number = len(clauses)
+        self.learned = [False] * len(clauses)  # flags of clauses which can be deleted
+        self.lbd = [0] * len(clauses)           # literal block distance of learned clauses
+        self.tiers = [None] * len(clauses)      # tier of learned clauses (None for original ones)
+        self.clause_activity = [0.0] * len(clauses)
+        self.last_used = [0] * len(clauses)     # conflict number of the last use in conflict analysis
+        self.clause_increment = 1.0
+        self.clause_decay = 0.999
+
+        # schedule of the 'tiered' clause database reduction
+        self.conflicts_total = 0
+        self.reductions_counter = 0
+        self.reduce_interval = 1000
+        self.reduce_increment = 300
+        self.next_reduction = self.reduce_interval
+        self.last_reduction = 0
+        self.variables_number = max((abs(l) for clause in clauses for l in clause), default=0)
+        self.assumptions = list(assumptions)    # assumptions used by solve() called without arguments
+        self.failed_assumptions = []            # subset of assumptions responsible for the last UNSAT answer
+        self.ok = True                          # False once the clauses alone are known to be UNSAT
+        self.clause_exchange = clause_exchange  # shared learned clauses of parallel workers (None if not used)
+        self.proof = proof                      # ProofWriter logging learned and deleted clauses (None if not used)
+        if proof is not None and clause_exchange is not None:
+            # imported clauses are not derivable from the clauses of this solver by unit propagation
+            raise ValueError("Proofs cannot be logged with clause exchange")
+        self.budget = Budget()                  # limits of each solve() call, unlimited by default
+        self.resumable = False                  # True if the last solve() call stopped with UNKNOWN
 
         self.restart_type = restart
-        self.decision_heuristics = DecisionHeuristics(decision, clauses, assumptions)
-        if restart is None:
+        self.partial_restart = partial_restart
+        self.phase_saving = phase_saving
+        self.decision_heuristics = DecisionHeuristics(decision, clauses)
+        if restart is None or restart == "glucose":
             self.conflicts_maximum = float('inf')
+            if restart == "glucose":
+                self.glucose = GlucoseRestarts()
         else:
             self.conflicts_maximum = 4
             if restart == "Luby":
                 self.luby = Luby()
 
-        self.reinitialize(clauses)
+        # a literal repeated in a clause would be watched twice, Tseitin encodings produce such clauses
+        self.reinitialize([clause if len(set(clause)) == len(clause) else list(dict.fromkeys(clause))
+                           for clause in clauses])
 
     def reinitialize(self, clauses):
-        self.clauses = clauses      # list containing all clauses
-        self.assignment = []        # queue containing assigned literals
+        self.clauses = clauses      # list containing all clauses (None for deleted ones)
+        self.free_indices = []      # indices of deleted clauses which can be reused
+        self.assignment = []        # queue containing assigned literals (the trail)
         self.dec_levels = []        # similar queue but containing decision levels of corresponding assigned literals
-        self.antecedents = dict()   # mapping from literals to clause indices
         self.decision_level = 0     # current decision level
         self.conflicts_counter = 0
+        self.propagation_head = 0   # position in the trail of the next literal to propagate
         self.decision_heuristics.reinitialize(clauses)
 
+        # per-variable arrays indexed by variable, index 0 is unused
+        n = self.variables_number + 1
+        self.values = [0] * n       # 1 if the variable is true, -1 if false, 0 if unassigned
+        self.levels = [-1] * n      # decision level of the assignment
+        self.reasons = [-1] * n     # antecedent clause index (-1 for decisions)
+        self.trail_pos = [-1] * n   # position of the assignment in the trail
+        self.seen = [False] * n     # markers of variables visited by conflict analysis
+        self.saved_phases = [0] * n # last values of unassigned variables used by phase saving
+
         self.watched_literals = dict()
-        self.unit_literals = set()  # set of literals used during unit propagation
+        self.unit_literals = set()  # set of unit clause literals found during initialization
 
-        for i, clause in enumerate(clauses):
-            for literal in clause:
-                # watched literals initialization
-                if literal not in self.watched_literals:
-                    self.watched_literals[literal] = set()
-                if -literal not in self.watched_literals:
-                    self.watched_literals[-literal] = set()
+        for var in range(1, n):
+            # watched literals initialization
+            self.watched_literals[var] = set()
+            self.watched_literals[-var] = set()
 
         # watched literals setting & unit clauses finding
         for i, clause in enumerate(clauses):
@@ -155,64 +419,126 @@ class CDCL_solver:
                 self.watched_literals[clause[1]].add(i)
             elif len(clause) == 1:
                 self.unit_literals.add(clause[0])
+                self.reasons[abs(clause[0])] = i
+
+    def add_variable(self, var):
+        """Extends the per-variable arrays and watch lists with a new variable"""
+        if var not in self.watched_literals:
+            self.watched_literals[var] = set()
+            self.watched_literals[-var] = set()
+        self.decision_heuristics.add_variable(var)
+        while self.variables_number < var:
+            self.variables_number += 1
+            self.values.append(0)
+            self.levels.append(-1)
+            self.reasons.append(-1)
+            self.trail_pos.append(-1)
+            self.seen.append(False)
+            self.saved_phases.append(0)
+
+    def add_clause(self, clause):
+        """Adds an original clause, the solver keeps its learned clauses and heuristic scores"""
+        if self.proof is not None:
+            # the checker knows only the initial clauses, later lemmas would depend on this one
+            raise ValueError("Clauses cannot be added to a solver logging a proof")
+        self.backtrack(0)
+        clause = list(dict.fromkeys(clause))
+        if any(-l in clause for l in clause):
+            return      # 'True' clause
+        for l in clause:
+            self.add_variable(abs(l))
+        self.decision_heuristics.add_clause(clause)
+
+        # non-falsified literals are watched, i.e. moved to the first two positions
+        clause.sort(key=lambda l: self.literal_value(l) < 0)
+        new_clause_index = self.store_clause(clause, learned=False)
+        if len(clause) == 0 or self.literal_value(clause[0]) < 0:
+            self.ok = False
+            return
+        self.watched_literals[clause[0]].add(new_clause_index)
+        if len(clause) >= 2:
+            self.watched_literals[clause[1]].add(new_clause_index)
+        if (len(clause) == 1 or self.literal_value(clause[1]) < 0) and self.literal_value(clause[0]) == 0:
+            self.assign(clause[0], new_clause_index)
+
+    def literal_value(self, literal):
+        """Returns 1 if the literal is satisfied, -1 if falsified and 0 if unassigned"""
+        value = self.values[abs(literal)]
+        return value if literal > 0 else -value
+
+    def assign(self, literal, reason):
+        """Puts the literal on the trail and records its level, reason and trail position"""
+        var = abs(literal)
+        self.values[var] = 1 if literal > 0 else -1
+        self.levels[var] = self.decision_level
+        self.reasons[var] = reason
+        self.trail_pos[var] = len(self.assignment)
+        self.assignment.append(literal)
+        self.dec_levels.append(self.decision_level)
 
     def unit_propagation(self):
         """Returns conflict clause id or -1 if no conflict exists"""
 
-        conflict_clause = -1
+        # unit clauses are assigned at level 0 before the first propagation
         while len(self.unit_literals) > 0:
             unit_literal = self.unit_literals.pop()
-            conflict_clause, unit_literals = self.unit_propagate_literal(unit_literal)
+            value = self.literal_value(unit_literal)
+            if value == 0:
+                self.assign(unit_literal, self.reasons[abs(unit_literal)])
+            elif value < 0:
+                return self.reasons[abs(unit_literal)]
+
+        while self.propagation_head < len(self.assignment):
+            if self.unit_prop_counter >= self.budget.next_check and self.budget.is_exhausted(self.unit_prop_counter):
+                # the rest of the trail is propagated when the search is resumed
+                return -1
+            literal = self.assignment[self.propagation_head]
+            self.propagation_head += 1
+            conflict_clause = self.unit_propagate_literal(literal)
             if conflict_clause >= 0:
                 return conflict_clause
-            else:
-                self.unit_literals = self.unit_literals.union(unit_literals)
 
-        return conflict_clause
+        return -1
 
     def unit_propagate_literal(self, literal):
-        """Returns id of conflict clause (or -1) and a set of found unit literals"""
+        """Returns id of conflict clause (or -1), found unit literals are assigned immediately"""
 
         self.unit_prop_counter += 1
-        self.assignment.append(literal)
-        self.dec_levels.append(self.decision_level)
+        values = self.values
 
         # trying to change watched literals in clauses where 'not literal' is watched
-        found_unit_literals = set()
         not_longer_watched = list()
         conflict_clause = -1
 
         for clause_index in self.watched_literals[-literal]:
             self.checked_clauses_counter += 1
+            clause = self.clauses[clause_index]
             next_watched_literal = None
             possible_unit_literal = None
-            possible_unit_literal_satisfied = None
+            possible_unit_literal_value = 0
 
-            if len(self.clauses[clause_index]) == 1:
+            if len(clause) == 1:
                 conflict_clause = clause_index
-                continue
+                break
 
-            neg_literal_offset = self.clauses[clause_index].index(-literal)
-            for i in range(neg_literal_offset + 1, neg_literal_offset + len(self.clauses[clause_index])):
-                l = self.clauses[clause_index][i % len(self.clauses[clause_index])]
+            neg_literal_offset = clause.index(-literal)
+            for i in range(neg_literal_offset + 1, neg_literal_offset + len(clause)):
+                l = clause[i % len(clause)]
+                value = values[l] if l > 0 else -values[-l]
                 if clause_index in self.watched_literals[l]:
                     # 'l' is another watched literal in this clause
                     possible_unit_literal = l
-                    if possible_unit_literal in self.assignment:
-                        possible_unit_literal_satisfied = True
-                    if -possible_unit_literal in self.assignment:
-                        possible_unit_literal_satisfied = False
-                else:
-                    if not next_watched_literal and -l not in self.assignment:
-                        next_watched_literal = l
+                    possible_unit_literal_value = value
+                elif next_watched_literal is None and value >= 0:
+                    next_watched_literal = l
 
             if next_watched_literal is None:
                 # watched 'literal' cannot move in this clause
-                if possible_unit_literal_satisfied is None:
-                    found_unit_literals.add(possible_unit_literal)
-                    self.antecedents[possible_unit_literal] = clause_index
-                elif not possible_unit_literal_satisfied:
+                if possible_unit_literal_value == 0:
+                    self.assign(possible_unit_literal, clause_index)
+                elif possible_unit_literal_value < 0:
                     conflict_clause = clause_index
+                    break
             else:
                 not_longer_watched.append(clause_index)
                 self.watched_literals[next_watched_literal].add(clause_index)
@@ -220,192 +546,730 @@ class CDCL_solver:
         for clause_index in not_longer_watched:
             self.watched_literals[-literal].remove(clause_index)
 
-        return conflict_clause, found_unit_literals
+        return conflict_clause
 
     def conflict_analysis(self, conflict_clause_id):
         """Returns backtrack level, learned clause and the latest assigned literal from this clause"""
         self.conflicts_counter += 1
-
-        if self.conflicts_counter > self.conflicts_maximum:
-            return -10, None, None
-
-        # searching for an assertive clause with 1-UIP
-        C = set(self.clauses[conflict_clause_id])
+        self.conflicts_total += 1
+
+        if self.decision_level == 0:
+            return -1, None, None
+
+        # walking the trail backwards and resolving until the first UIP is found
+        seen = self.seen
+        levels = self.levels
+        learned_clause = [None]     # the first position is reserved for the UIP literal
+        current_level_literals = 0  # number of marked literals at the current level which are not resolved yet
+        trail_index = len(self.assignment) - 1
+        clause_index = conflict_clause_id
+        resolved_var = 0
         while True:
-            literals_at_d_counter = 0
-            latest_assignment_time = -1
-            second_latest_ass_time = -1
-            for literal in C:
-                assignment_time = self.assignment.index(-literal)
-                if self.dec_levels[assignment_time] == self.decision_level:
-                    literals_at_d_counter += 1
-                if assignment_time >= latest_assignment_time:
-                    second_latest_ass_time = latest_assignment_time
-                    latest_assignment_time = assignment_time
-                elif assignment_time > second_latest_ass_time:
-                    second_latest_ass_time = assignment_time
-
-            if literals_at_d_counter <= 1:
-                learned_clause = list(C)
-                if len(learned_clause) == 1:
-                    if self.decision_level == 0:
-                        return -1, None, None
+            self.bump_clause(clause_index)
+            for literal in self.clauses[clause_index]:
+                var = abs(literal)
+                if var != resolved_var and not seen[var] and levels[var] > 0:
+                    seen[var] = True
+                    self.decision_heuristics.bump_variable(var)
+                    if levels[var] == self.decision_level:
+                        current_level_literals += 1
                     else:
-                        return 0, learned_clause, learned_clause[0]
+                        learned_clause.append(literal)
+
+            while not seen[abs(self.assignment[trail_index])]:
+                trail_index -= 1
+            resolved_var = abs(self.assignment[trail_index])
+            trail_index -= 1
+            seen[resolved_var] = False
+            current_level_literals -= 1
+            if current_level_literals == 0:
+                break
+            clause_index = self.reasons[resolved_var]
+
+        uip_literal = -self.assignment[trail_index + 1]
+        learned_clause[0] = uip_literal
+
+        learned_clause = self.minimize_learned_clause(learned_clause)
+
+        if len(learned_clause) == 1:
+            return 0, learned_clause, uip_literal
+        # the literal from the highest remaining level determines the backtrack level
+        max_index = max(range(1, len(learned_clause)), key=lambda i: levels[abs(learned_clause[i])])
+        learned_clause[1], learned_clause[max_index] = learned_clause[max_index], learned_clause[1]
+        return levels[abs(learned_clause[1])], learned_clause, uip_literal
+
+    def minimize_learned_clause(self, learned_clause):
+        """Removes literals implied by other literals of the clause (recursive minimization)"""
+        seen = self.seen
+        abstract_levels = 0
+        for literal in learned_clause[1:]:
+            abstract_levels |= 1 << (self.levels[abs(literal)] & 31)
+
+        to_clear = [abs(literal) for literal in learned_clause[1:]]
+        minimized_clause = [learned_clause[0]]
+        for literal in learned_clause[1:]:
+            if self.reasons[abs(literal)] == -1 or not self.is_redundant(literal, abstract_levels, to_clear):
+                minimized_clause.append(literal)
+
+        for var in to_clear:
+            seen[var] = False
+        return minimized_clause
+
+    def is_redundant(self, literal, abstract_levels, to_clear):
+        """Returns True if the literal is implied by marked literals, marks visited variables on success"""
+        seen, levels, reasons = self.seen, self.levels, self.reasons
+        stack = [abs(literal)]
+        top = len(to_clear)
+        while len(stack) > 0:
+            var = stack.pop()
+            for l in self.clauses[reasons[var]]:
+                v = abs(l)
+                if v == var or seen[v] or levels[v] == 0:
+                    continue
+                if reasons[v] != -1 and (1 << (levels[v] & 31)) & abstract_levels:
+                    seen[v] = True
+                    stack.append(v)
+                    to_clear.append(v)
                 else:
-                    return self.dec_levels[second_latest_ass_time], learned_clause, -self.assignment[latest_assignment_time]
-
-            resolved_literal = -self.assignment[latest_assignment_time]
-            C.remove(resolved_literal)
-
-            if -resolved_literal in self.antecedents:  # otherwise it's contained in a unit clause
-                for literal in self.clauses[self.antecedents[-resolved_literal]]:
-                    if literal != -resolved_literal:
-                        C.add(literal)
-
-    def join_learned_clause(self, clause, unit_literal):
-        new_clause_index = len(self.clauses)
-        self.clauses.append(clause)
+                    # a decision or a literal from a level not contained in the clause
+                    for v in to_clear[top:]:
+                        seen[v] = False
+                    del to_clear[top:]
+                    return False
+        return True
+
+    def compute_lbd(self, clause):
+        """Returns the number of distinct decision levels of literals in the clause"""
+        return len(set(self.levels[abs(l)] for l in clause))
+
+    def get_tier(self, lbd):
+        if lbd <= 2:
+            return CORE
+        elif lbd <= 6:
+            return TIER2
+        return LOCAL
+
+    def bump_clause(self, clause_index):
+        """Updates activity, last use and LBD of a learned clause used in conflict analysis"""
+        if not self.learned[clause_index]:
+            return
+        self.last_used[clause_index] = self.conflicts_total
+        self.clause_activity[clause_index] += self.clause_increment
+        if self.clause_activity[clause_index] > 1e20:
+            for i in range(len(self.clause_activity)):
+                self.clause_activity[i] *= 1e-20
+            self.clause_increment *= 1e-20
+
+        if self.tiers[clause_index] != CORE:
+            # all literals are assigned during conflict analysis
+            lbd = self.compute_lbd(self.clauses[clause_index])
+            if lbd < self.lbd[clause_index]:
+                self.lbd[clause_index] = lbd
+                if self.get_tier(lbd) != LOCAL:
+                    self.tiers[clause_index] = self.get_tier(lbd)
+
+    def store_clause(self, clause, learned, lbd=0):
+        """Returns the index of the stored clause, slots of deleted clauses are reused"""
+        if len(self.free_indices) > 0:
+            clause_index = self.free_indices.pop()
+            self.clauses[clause_index] = clause
+        else:
+            clause_index = len(self.clauses)
+            self.clauses.append(clause)
+            self.learned.append(False)
+            self.lbd.append(0)
+            self.tiers.append(None)
+            self.clause_activity.append(0.0)
+            self.last_used.append(0)
+
+        self.learned[clause_index] = learned
+        self.lbd[clause_index] = lbd
+        self.tiers[clause_index] = self.get_tier(lbd) if learned else None
+        self.clause_activity[clause_index] = self.clause_increment if learned else 0.0
+        self.last_used[clause_index] = self.conflicts_total
+        return clause_index
+
+    def remove_clause(self, clause_index):
+        """Detaches watches of a single clause and frees its slot"""
+        for l in self.clauses[clause_index]:
+            self.watched_literals[l].discard(clause_index)
+        if self.proof is not None:
+            self.proof.delete_clause(self.clauses[clause_index])
+        self.clauses[clause_index] = None
+        self.learned[clause_index] = False
+        self.tiers[clause_index] = None
+        self.free_indices.append(clause_index)
+
+    def is_locked(self, clause_index):
+        """Returns True if the clause is the reason of a current assignment"""
+        for l in self.clauses[clause_index]:
+            if self.reasons[abs(l)] == clause_index and self.literal_value(l) > 0:
+                return True
+        return False
+
+    def join_learned_clause(self, clause, unit_literal, lbd):
+        """Adds the learned clause and assigns its unit literal, must be called after backtracking"""
+        new_clause_index = self.store_clause(clause, learned=True, lbd=lbd)
+        if self.proof is not None:
+            self.proof.add_clause(clause)
         self.watched_literals[unit_literal].add(new_clause_index)
         if len(clause) >= 2:
-            if unit_literal != clause[0]:
-                self.watched_literals[clause[0]].add(new_clause_index)
-            else:
-                self.watched_literals[clause[1]].add(new_clause_index)
+            # the second watch is the most recently falsified literal, it becomes unassigned first
+            other_literal = max((l for l in clause if l != unit_literal), key=lambda l: self.trail_pos[abs(l)])
+            self.watched_literals[other_literal].add(new_clause_index)
         self.decision_heuristics.process_new_clause(clause)
-
-        self.antecedents[unit_literal] = new_clause_index
-        self.unit_literals = {unit_literal}
+        self.clause_increment /= self.clause_decay
+        if self.clause_exchange is not None:
+            self.clause_exchange.export_clause(clause, lbd)
+
+        self.assign(unit_literal, new_clause_index)
+
+    def import_shared_clauses(self):
+        """Adds clauses learned by other workers, must be called at decision level 0"""
+        if not self.clause_exchange.has_new_clauses():
+            return
+        for clause, lbd in self.clause_exchange.import_clauses():
+            if any(self.literal_value(l) > 0 for l in clause):
+                continue
+            # literals falsified at level 0 are false forever
+            clause = [l for l in clause if self.literal_value(l) == 0]
+            if len(clause) == 0:
+                self.ok = False
+                return
+            new_clause_index = self.store_clause(clause, learned=True, lbd=min(lbd, len(clause)))
+            self.decision_heuristics.add_clause(clause)
+            self.watched_literals[clause[0]].add(new_clause_index)
+            if len(clause) >= 2:
+                self.watched_literals[clause[1]].add(new_clause_index)
+            else:
+                self.assign(clause[0], new_clause_index)
 
     def backtrack(self, backtrack_level):
         while len(self.assignment) > 0 and self.dec_levels[-1] > backtrack_level:
-            self.assignment.pop()
+            var = abs(self.assignment.pop())
             self.dec_levels.pop()
+            self.saved_phases[var] = self.values[var]
+            self.values[var] = 0
+            self.levels[var] = -1
+            self.trail_pos[var] = -1
+            self.decision_heuristics.unassign_variable(var)
         self.decision_level = backtrack_level
+        self.propagation_head = min(self.propagation_head, len(self.assignment))
+
+    def get_restart_level(self):
+        """Returns the level to backtrack to, partial restarts keep decisions which would be made again"""
+        if not self.partial_restart:
+            return 0
+        best_score = self.decision_heuristics.get_best_score(self.values)
+        if best_score is None:
+            return 0
+
+        for literal in self.assignment:
+            var = abs(literal)
+            if self.reasons[var] == -1 and self.levels[var] > len(self.assumptions):
+                # the first decision with a lower score than the next decision would be changed
+                if self.decision_heuristics.get_score(literal) < best_score:
+                    return self.levels[var] - 1
+        return self.decision_level
 
     def restart(self):
+        """Backtracks the trail, the clause database and watched literals are kept"""
         self.restarts_counter += 1
+        self.conflicts_counter = 0
 
         if self.restart_type == "geometric":
             self.conflicts_maximum *= 1.5
         elif self.restart_type == "Luby":
             self.conflicts_maximum = self.luby.constant * self.luby.get_next()
+        elif self.restart_type == "glucose":
+            self.glucose.on_restart()
+
+        deleted_clauses = self.select_deleted_clauses()
+        if self.clause_exchange is not None and self.clause_exchange.has_new_clauses():
+            # shared clauses are imported at level 0, so the trail is not reused this time
+            self.backtrack(0)
+            self.import_shared_clauses()
+        else:
+            self.backtrack(self.get_restart_level())
+        for clause_index in deleted_clauses:
+            if not self.is_locked(clause_index):
+                self.remove_clause(clause_index)
 
-        new_clauses = self.delete_clauses()
-        self.reinitialize(new_clauses)
-
-    def delete_clauses(self):
-        if self.deletion is None:
-            return self.clauses
+    def select_deleted_clauses(self):
+        """Returns indices of learned clauses which should be deleted, kept ones are not deleted any more"""
+        if self.deletion is None or self.deletion == "tiered":
+            return []
 
-        new_clauses = self.clauses[:self.original_clauses_number]
+        kept_clauses = set()
         if self.deletion == "short":
-            for i in range(self.original_clauses_number, len(self.clauses)):
-                if len(self.clauses[i]) <= math.log2(self.restarts_counter) + 1:
-                    new_clauses.append(self.clauses[i])
+            for i in range(len(self.clauses)):
+                if self.learned[i] and len(self.clauses[i]) <= math.log2(self.restarts_counter) + 1:
+                    kept_clauses.add(i)
 
         elif self.deletion == "LBD":
-            decision_levels_counter = set()
-            for i in range(self.original_clauses_number, len(self.clauses)):
-                decision_levels_counter.clear()
-                for l in self.clauses[i]:
-                    if -l in self.assignment:
-                        dec_level = self.dec_levels[self.assignment.index(-l)]
-                        decision_levels_counter.add(dec_level)
-                if len(decision_levels_counter) <= math.log2(self.restarts_counter) + 1:
-                    new_clauses.append(self.clauses[i])
+            for i in range(len(self.clauses)):
+                if self.learned[i] and self.lbd[i] <= math.log2(self.restarts_counter) + 1:
+                    kept_clauses.add(i)
 
         elif self.deletion == "active":
             clause_activity = dict()
 
-            for clause_index in self.antecedents.values():
-                if clause_index >= self.original_clauses_number:
+            for clause_index in self.reasons:
+                if clause_index >= 0 and self.learned[clause_index]:
                     if clause_index in clause_activity:
                         clause_activity[clause_index] += 1
                     else:
                         clause_activity[clause_index] = 1
-            for i in range(self.original_clauses_number, len(self.clauses)):
+            for i in range(len(self.clauses)):
                 if i in clause_activity and clause_activity[i] >= math.log10(self.restarts_counter) - 1:
-                        new_clauses.append(self.clauses[i])
-
-        self.original_clauses_number = len(new_clauses)
-        return new_clauses
+                        kept_clauses.add(i)
+
+        deleted_clauses = []
+        for i in range(len(self.clauses)):
+            if i in kept_clauses:
+                self.learned[i] = False
+            elif self.learned[i]:
+                deleted_clauses.append(i)
+        return deleted_clauses
+
+    def reduce_clause_database(self):
+        """Demotes unused mid-tier clauses and deletes the less active half of local clauses"""
+        self.reductions_counter += 1
+        self.next_reduction = self.conflicts_total + self.reduce_interval + self.reductions_counter * self.reduce_increment
+
+        local_clauses = []
+        for i in range(len(self.clauses)):
+            if not self.learned[i]:
+                continue
+            if self.tiers[i] == TIER2 and self.last_used[i] < self.last_reduction:
+                self.tiers[i] = LOCAL
+            if self.tiers[i] == LOCAL and not self.is_locked(i):
+                local_clauses.append(i)
+        self.last_reduction = self.conflicts_total
+
+        local_clauses.sort(key=lambda i: self.clause_activity[i])
+        for i in local_clauses[:len(local_clauses) // 2]:
+            self.remove_clause(i)
+
+    def get_learned_clauses_counts(self):
+        """Returns numbers of stored learned clauses in each tier"""
+        counts = {CORE: 0, TIER2: 0, LOCAL: 0}
+        for i in range(len(self.clauses)):
+            if self.learned[i]:
+                counts[self.tiers[i]] += 1
+        return counts
+
+    def get_memory_usage(self):
+        """Returns an estimate of bytes used by clauses, watched literals and clause metadata"""
+        size = sys.getsizeof(self.clauses)
+        for clause in self.clauses:
+            if clause is not None:
+                size += sys.getsizeof(clause)
+        for watches in self.watched_literals.values():
+            size += sys.getsizeof(watches)
+        for metadata in [self.learned, self.lbd, self.tiers, self.clause_activity, self.last_used]:
+            size += sys.getsizeof(metadata)
+        return size
+
+    def analyze_final(self, literal):
+        """Returns the assumptions which together with the clauses imply the negation of falsified assumption"""
+        failed = [literal]
+        seen = {abs(literal)}
+        for i in range(len(self.assignment) - 1, -1, -1):
+            if self.dec_levels[i] == 0:
+                break
+            var = abs(self.assignment[i])
+            if var in seen:
+                if self.reasons[var] == -1:
+                    # decisions below the last assumption level are assumptions
+                    failed.append(self.assignment[i])
+                else:
+                    for l in self.clauses[self.reasons[var]]:
+                        if self.levels[abs(l)] > 0:
+                            seen.add(abs(l))
+        return failed
 
     def try_to_solve(self):
-        conflict_clause = self.unit_propagation()
-        if conflict_clause >= 0:
-            return None
-
         while True:
-            current_literal = self.decision_heuristics.get_literal(self.assignment)
-
-            if current_literal is None:
-                # all variables assigned
-                return self.assignment
-            self.decisions_counter += 1
-            self.decision_level += 1
-            self.unit_literals = {current_literal}
-
-            while True:
-                conflict_clause = self.unit_propagation()
-                if conflict_clause == -1:
-                    break
-
+            conflict_clause = self.unit_propagation()
+            if conflict_clause >= 0:
                 backtrack_level, learned_clause, new_unit_literal = self.conflict_analysis(conflict_clause)
                 if backtrack_level == -1:
+                    self.ok = False
+                    if self.proof is not None:
+                        self.proof.add_clause([])
                     return None
-                elif backtrack_level == -10:
-                    return "restart"
 
-                self.join_learned_clause(learned_clause, new_unit_literal)
+                lbd = self.compute_lbd(learned_clause)
+                restart_due = self.restart_type == "glucose" and self.glucose.on_conflict(lbd, len(self.assignment))
                 self.backtrack(backtrack_level)
+                self.join_learned_clause(learned_clause, new_unit_literal, lbd)
+                if self.clause_exchange is not None and backtrack_level == 0:
+                    self.import_shared_clauses()
+                    if not self.ok:
+                        return None
+                if self.deletion == "tiered" and self.conflicts_total >= self.next_reduction:
+                    self.reduce_clause_database()
+                if self.conflicts_total >= self.budget.conflict_limit:
+                    return UNKNOWN
+                if restart_due or self.conflicts_counter > self.conflicts_maximum:
+                    return "restart"
+                continue
 
-    def solve(self):
+            if self.propagation_head < len(self.assignment):
+                # propagation was stopped by the budget
+                return UNKNOWN
+
+            if self.decision_level < len(self.assumptions):
+                # every assumption gets its own decision level
+                current_literal = self.assumptions[self.decision_level]
+                value = self.literal_value(current_literal)
+                if value > 0:
+                    self.decision_level += 1
+                    continue
+                elif value < 0:
+                    self.failed_assumptions = self.analyze_final(current_literal)
+                    return None
+            else:
+                current_literal = self.decision_heuristics.get_literal(self.assignment, self.values)
+                if self.phase_saving and current_literal is not None and self.saved_phases[abs(current_literal)] != 0:
+                    current_literal = abs(current_literal) * self.saved_phases[abs(current_literal)]
+
+            if current_literal is None:
+                # all variables assigned
+                return self.assignment[:]
+            self.decisions_counter += 1
+            self.decision_level += 1
+            self.assign(current_literal, -1)
+
+    def set_budget(self, conflicts=None, propagations=None, time_limit=None):
+        """Limits following solve() calls, None means no limit"""
+        self.budget.conflicts = conflicts
+        self.budget.propagations = propagations
+        self.budget.time_limit = time_limit
+
+    def interrupt(self):
+        """Stops the running or the next solve() call with UNKNOWN, can be called from another thread"""
+        self.budget.interrupt()
+
+    def solve(self, assumptions=None):
+        """Returns a satisfying assignment, None or UNKNOWN, can be called repeatedly with different assumptions
+
+        A call stopped by the budget or by interrupt() returns UNKNOWN, the next call without new assumptions
+        continues from the same trail.
+        """
+        resume = self.resumable and assumptions is None
+        self.resumable = False
+        if assumptions is not None:
+            self.assumptions = list(assumptions)
+        for literal in self.assumptions:
+            self.add_variable(abs(literal))
+        self.failed_assumptions = []
+        if not self.ok:
+            return None
+        if not resume:
+            self.backtrack(0)
+        self.budget.start(self.conflicts_total, self.unit_prop_counter)
+        result = self.search()
+        self.resumable = result == UNKNOWN
+        return result
+
+    def search(self):
+        """Continues the search from the current trail, returns a satisfying assignment or None"""
         solution_found = False
         result = None
         while not solution_found:
             result = self.try_to_solve()
-            if result is None or result != "restart":
+            if result != "restart":
                 solution_found = True
             else:
                 self.restart()
+                if not self.ok:
+                    return None
 
         return result
 
+    def get_statistics(self):
+        """Returns search counters, e.g. of a call stopped by the budget"""
+        return {
+            'decisions': self.decisions_counter,
+            'unit propagation steps': self.unit_prop_counter,
+            'checked clauses': self.checked_clauses_counter,
+            'conflicts': self.conflicts_total,
+            'restarts': self.restarts_counter,
+        }
+
+    def shrink_model(self, projection):
+        """Returns literals of the current model over projected variables which are needed to satisfy original clauses
+
+        Every original clause needs one true literal, already needed literals and literals of unprojected variables
+        (e.g. Tseitin variables) are preferred. Any assignment extending the returned projected literals together
+        with the needed unprojected ones satisfies the clauses, including blocking clauses of previous models,
+        so the returned cubes of models are disjoint.
+        """
+        needed = set()
+        for i, clause in enumerate(self.clauses):
+            if clause is None or self.tiers[i] is not None:
+                continue
+            true_literals = [l for l in clause if self.literal_value(l) > 0]
+            if any(abs(l) in needed for l in true_literals):
+                continue
+            needed.add(abs(next((l for l in true_literals if abs(l) not in projection), true_literals[0])))
+        return [var * self.values[var] for var in projection if var in needed]
+
+    def add_blocking_clause(self, clause):
+        """Adds a clause falsified by the current model and backtracks only until it becomes unit"""
+        if self.proof is not None:
+            raise ValueError("Blocking clauses cannot be added to a solver logging a proof")
+        if len(clause) == 0:
+            self.ok = False
+            return
+        self.decision_heuristics.add_clause(clause)
+        # literals of the highest levels are watched, they become unassigned first
+        clause = sorted(clause, key=lambda l: self.levels[abs(l)], reverse=True)
+        second_level = self.levels[abs(clause[1])] if len(clause) >= 2 else 0
+        if self.levels[abs(clause[0])] == 0:
+            self.ok = False
+            return
+        self.backtrack(second_level if second_level < self.levels[abs(clause[0])] else second_level - 1)
+        new_clause_index = self.store_clause(clause, learned=False)
+        self.watched_literals[clause[0]].add(new_clause_index)
+        if len(clause) >= 2:
+            self.watched_literals[clause[1]].add(new_clause_index)
+        if len(clause) == 1 or self.literal_value(clause[1]) < 0:
+            self.assign(clause[0], new_clause_index)
+
+    def enumerate_models(self, projection=None, limit=None, shrink=False):
+        """Yields models projected to the given variables (all variables by default), at most 'limit' of them
+
+        Each model is excluded by a blocking clause over the projected variables and the search continues from
+        the current trail with learned clauses kept. With 'shrink' the models are shortened to cubes of projected
+        literals whose every extension is a model, unassigned variables are free then. The budget is shared
+        by the whole enumeration, which ends early when it is exhausted.
+        """
+        if projection is None:
+            projection = range(1, self.variables_number + 1)
+        projection = [var for var in projection if var <= self.variables_number]
+        assignment = self.solve()
+        models_counter = 0
+        while assignment is not None and assignment != UNKNOWN and (limit is None or models_counter < limit):
+            if shrink:
+                model = self.shrink_model(set(projection))
+            else:
+                # variables without clauses are never assigned, they are free as well
+                model = [var * self.values[var] for var in projection if self.values[var] != 0]
+            models_counter += 1
+            yield model
+            if models_counter == limit:
+                # no blocking clause and no search for a model which would not be reported
+                return
+
+            self.add_blocking_clause([-l for l in model])
+            if not self.ok:
+                return
+            assignment = self.search()
+
+
+class PortfolioCancelled(Exception):
+    """Raised in a portfolio worker when another worker has already found the answer"""
+
+
+def cancel_worker(signum, frame):
+    raise PortfolioCancelled()
+
+
+def portfolio_worker(worker_id, clauses, configuration, seed, results, clause_exchange=None):
+    """Solves the clauses in its own process and puts the answer with statistics into the 'results' queue"""
+    signal.signal(signal.SIGTERM, cancel_worker)
+    random.seed(seed)
+    if clause_exchange is not None:
+        clause_exchange.attach(worker_id)
+    start = time.time()
+    solver = None
+    answer = 'cancelled'
+    assignment = None
+    try:
+        restart, deletion, decision, partial_restart, phase_saving = configuration
+        solver = CDCL_solver(clauses, restart, deletion, decision, partial_restart=partial_restart,
+                             clause_exchange=clause_exchange, phase_saving=phase_saving)
+        assignment = solver.solve()
+        answer = 'UNSAT' if assignment is None else 'SAT'
+    except PortfolioCancelled:
+        pass
+    finally:
+        # the answer has to be reported even if the worker is cancelled right now
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    statistics = {'CPU time': time.time() - start}
+    if solver is not None:
+        statistics.update(solver.get_statistics())
+    if clause_exchange is not None:
+        statistics.update(clause_exchange.get_statistics())
+    results.put((worker_id, answer, assignment, statistics))
+
+
+def solve_portfolio(clauses, workers, seed=42, sharing=True):
+    """Runs differently configured solvers in parallel, the first answer wins and the other workers are cancelled
+
+    With 'sharing' the workers exchange short learned clauses through shared memory.
+
+    Returns the assignment (None for UNSAT), id of the winning worker and a list of
+    (configuration, seed, answer, statistics) of all workers.
+    """
+    results = multiprocessing.Queue()
+    clause_exchange = ClauseExchange(workers) if sharing else None
+    configurations = [PORTFOLIO_CONFIGURATIONS[i % len(PORTFOLIO_CONFIGURATIONS)] for i in range(workers)]
+    processes = [multiprocessing.Process(target=portfolio_worker,
+                                         args=(i, clauses, configurations[i], seed + i, results, clause_exchange),
+                                         daemon=True)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    reports = [None] * workers
+    winner = None
+    assignment = None
+    while winner is None:
+        try:
+            worker_id, answer, worker_assignment, statistics = results.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes) and results.empty():
+                raise RuntimeError("All portfolio workers exited without an answer")
+            continue
+        reports[worker_id] = (answer, statistics)
+        if answer != 'cancelled':
+            winner = worker_id
+            assignment = worker_assignment
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    # the queue has to be emptied before joining, otherwise workers block on flushing their reports
+    while any(report is None for report in reports):
+        try:
+            worker_id, answer, _, statistics = results.get(timeout=0.1)
+        except queue.Empty:
+            # workers cancelled before their start have nothing to report
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        reports[worker_id] = (answer, statistics)
+    for process in processes:
+        process.join()
+
+    return assignment, winner, [(configurations[i], seed + i) + (reports[i] or ('killed', dict()))
+                                for i in range(workers)]
+
+
+def decode_assignment(assignment, variables_mapping):
+    """Returns literals sorted by variables for .cnf inputs or names of the original variables for .sat inputs"""
+    if variables_mapping is None:
+        return sorted(assignment, key=abs)
+    assignment = set(assignment)
+    return [lit for lit, var in variables_mapping.items() if var in assignment] + \
+        ['-' + str(lit) for lit, var in variables_mapping.items() if -var in assignment]
+
 
 if __name__ == "__main__":
     args = parser.parse_args()
 
-    file_suffix = args.infile.name.split('.')[-1]
+    file_suffix = get_file_suffix(args.infile.name)
 
-    if file_suffix == 'sat':
-        clauses, variables_mapping = load_smtlib(args.infile)
-    elif file_suffix == 'cnf':
-        clauses = load_dimacs(args.infile)
-    else:
+    if file_suffix not in ['sat', 'cnf']:
         raise Exception("Unknown file type")
-
-    solver = CDCL_solver(clauses, args.restart, args.deletion, args.decision, [])
+    instrumentation = Instrumentation(print_progress if args.stats_interval > 0 else None, args.stats_interval)
+    with instrumentation.measure('parse'):
+        clauses, variables_mapping, root = load_instance(args.infile, file_suffix, None if args.no_cache else args.cache_dir)
+    if args.proof is not None and (args.preprocess or args.portfolio > 1):
+        parser.error("--proof cannot be used with --preprocess or --portfolio")
+    if args.models is not None and (args.preprocess or args.portfolio > 1 or args.proof is not None):
+        parser.error("--models cannot be used with --preprocess, --portfolio or --proof")
+    budget = (args.conflict_budget, args.propagation_budget, args.time_budget)
+    if budget != (None, None, None) and args.portfolio > 1:
+        parser.error("budgets cannot be used with --portfolio")
+    if args.preprocess:
+        with instrumentation.measure('preprocess'):
+            preprocessor = Preprocessor(clauses, args.preprocess_time, args.preprocess_growth)
+            clauses = preprocessor.get_clauses()
 
     start = time.time()
-    assignment = solver.solve()
+    if args.portfolio > 1:
+        assignment, winner, portfolio_reports = solve_portfolio(clauses, args.portfolio, sharing=not args.no_sharing)
+    else:
+        proof = None
+        if args.proof is not None:
+            proof = ProofWriter(args.proof, args.proof_format == 'binary', background=args.proof_thread)
+        with instrumentation.measure('init'):
+            solver = CDCL_solver(clauses, args.restart, args.deletion, args.decision, partial_restart=args.partial_restart,
+                                 phase_saving=args.phase_saving, proof=proof)
+        if args.stats is not None or args.stats_interval > 0:
+            # without statistics the solver runs its methods directly
+            instrumentation.attach_cdcl(solver)
+        solver.set_budget(*budget)
+        # Ctrl-C stops the search with UNKNOWN and the statistics are printed
+        signal.signal(signal.SIGINT, lambda signum, frame: solver.interrupt())
+        with instrumentation.measure('search'):
+            if args.models is None:
+                assignment = solver.solve()
+            else:
+                # only the original variables of .sat inputs are projected, auxiliary ones have numbers as names
+                projection = None if file_suffix == 'cnf' else \
+                    sorted(var for name, var in variables_mapping.items() if not name.isdigit())
+                if root is not None:
+                    # models of the formula, not only of its Tseitin clauses
+                    solver.add_clause([root])
+                models_counter = 0
+                for model in solver.enumerate_models(projection, args.models or None, args.shrink_models):
+                    models_counter += 1
+                    print('model', str(models_counter) + ':',
+                          decode_assignment(model, None if file_suffix == 'cnf' else variables_mapping), flush=True)
+                assignment = None
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        if proof is not None:
+            proof.close()
     end = time.time()
 
-    if assignment is None:
+    if args.preprocess and assignment is not None and assignment != UNKNOWN:
+        assignment = preprocessor.extend_model(assignment)
+
+    if args.models is not None:
+        print('number of models:', models_counter)
+    elif assignment == UNKNOWN:
+        print('UNKNOWN')
+    elif assignment is None:
         print('UNSAT')
     else:
         print('SAT')
         print('satisfying assignment:')
-        if file_suffix == 'cnf':
-            print(sorted(assignment, key=abs))
-        else:
-            decoded_assignment_pos = [lit for lit, var in variables_mapping.items() if var in assignment]
-            decoded_assignment_neg = ['-' + str(lit) for lit, var in variables_mapping.items() if -var in assignment]
-
-            print(decoded_assignment_pos + decoded_assignment_neg)
+        print(decode_assignment(assignment, None if file_suffix == 'cnf' else variables_mapping))
 
     print()
     print('CPU time:', "{:.2f}".format(end - start))
-    print('number of decisions:', solver.decisions_counter)
-    print('number of steps of unit propagation:', solver.unit_prop_counter)
-    print('total number of checked clauses:', solver.checked_clauses_counter)
+    if args.portfolio > 1:
+        print('winning worker:', winner)
+        for i, (configuration, seed, answer, statistics) in enumerate(portfolio_reports):
+            restart, deletion, decision, partial_restart, phase_saving = configuration
+            print()
+            print('worker', str(i) + ':', answer)
+            print('    configuration:', restart, deletion, decision, 'partial restart' if partial_restart else 'full restart',
+                  *(['phase saving'] if phase_saving else []))
+            print('    seed:', seed)
+            for name, value in statistics.items():
+                print('   ', name + ':', "{:.2f}".format(value) if isinstance(value, float) else value)
+    else:
+        print('number of decisions:', solver.decisions_counter)
+        print('number of conflicts:', solver.conflicts_total)
+        print('number of steps of unit propagation:', solver.unit_prop_counter)
+        print('total number of checked clauses:', solver.checked_clauses_counter)
+        learned_clauses_counts = solver.get_learned_clauses_counts()
+        print('number of stored learned clauses:', sum(learned_clauses_counts.values()),
+              '(' + ', '.join(tier + ': ' + str(count) for tier, count in learned_clauses_counts.items()) + ')')
+        print('clause database memory:', "{:.1f} kB".format(solver.get_memory_usage() / 1024))
+        if proof is not None:
+            for name, value in proof.get_statistics().items():
+                print(name + ':', value)
+    if args.preprocess:
+        for name, value in preprocessor.get_statistics().items():
+            print(name + ':', "{:.2f}".format(value) if isinstance(value, float) else value)
+    if args.stats is not None and args.portfolio <= 1:
+        write_statistics(instrumentation.get_statistics(), args.stats)
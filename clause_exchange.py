@@ -0,0 +1,97 @@
+from multiprocessing.sharedctypes import RawArray
+
+
+class ClauseExchange:
+    """Lock-free exchange of short learned clauses between solver processes
+
+    Every worker writes into its own ring buffer in shared memory and only reads the rings of the others,
+    so each ring has a single writer. A ring entry consists of the clause length, its LBD and the literals.
+    The head of a ring is the total number of integers written into it, readers keep their own cursors
+    and skip entries which were overwritten before they could read them. The writer fills up to
+    max_length + 2 integers behind the published head, so an entry is safe only if it is at least
+    that far from being overwritten.
+    """
+    def __init__(self, workers, capacity=1 << 16, max_length=10, max_lbd=4, import_limit=200):
+        self.workers = workers
+        self.capacity = capacity            # number of integers in a ring
+        self.max_length = max_length        # longer clauses are not exported
+        self.max_lbd = max_lbd              # clauses with higher LBD are not exported
+        self.import_limit = import_limit    # maximal number of clauses imported at once
+        self.rings = [RawArray('i', capacity) for _ in range(workers)]
+        self.heads = RawArray('q', workers)
+        self.worker_id = None
+
+    def attach(self, worker_id):
+        """Must be called by the worker process before exporting or importing clauses"""
+        self.worker_id = worker_id
+        self.cursors = [0] * self.workers
+        self.hashes = set()                 # hashes of clauses exported or imported by this worker
+        self.exported_counter = 0
+        self.imported_counter = 0
+        self.duplicates_counter = 0
+        self.lost_counter = 0               # entries overwritten before they were read
+
+    def export_clause(self, clause, lbd):
+        if len(clause) > self.max_length or lbd > self.max_lbd:
+            return
+        key = hash(tuple(sorted(clause)))
+        if key in self.hashes:
+            return
+        self.hashes.add(key)
+
+        ring = self.rings[self.worker_id]
+        head = self.heads[self.worker_id]
+        for i, value in enumerate([len(clause), lbd] + clause):
+            ring[(head + i) % self.capacity] = value
+        # the entry is published only after all its integers are written
+        self.heads[self.worker_id] = head + len(clause) + 2
+        self.exported_counter += 1
+
+    def has_new_clauses(self):
+        return any(self.heads[w] > self.cursors[w] for w in range(self.workers) if w != self.worker_id)
+
+    def import_clauses(self):
+        """Returns a list of (clause, LBD) pairs exported by other workers since the last import"""
+        clauses = []
+        for w in range(self.workers):
+            if w == self.worker_id:
+                continue
+            ring = self.rings[w]
+            cursor = self.cursors[w]
+            head = self.heads[w]
+            safe_distance = self.capacity - (self.max_length + 2)
+            while cursor < head and len(clauses) < self.import_limit:
+                if head - cursor > safe_distance:
+                    # the writer has already overwritten unread entries
+                    self.lost_counter += 1
+                    cursor = head
+                    break
+                length = ring[cursor % self.capacity]
+                lbd = ring[(cursor + 1) % self.capacity]
+                clause = [ring[(cursor + 2 + i) % self.capacity] for i in range(min(length, self.max_length))]
+                head = self.heads[w]
+                if head - cursor > safe_distance or not 0 < length <= self.max_length:
+                    # the entry was overwritten while being read
+                    self.lost_counter += 1
+                    cursor = head
+                    break
+                cursor += length + 2
+
+                key = hash(tuple(sorted(clause)))
+                if key in self.hashes:
+                    self.duplicates_counter += 1
+                    continue
+                self.hashes.add(key)
+                clauses.append((clause, lbd))
+            self.cursors[w] = cursor
+
+        self.imported_counter += len(clauses)
+        return clauses
+
+    def get_statistics(self):
+        return {
+            'exported clauses': self.exported_counter,
+            'imported clauses': self.imported_counter,
+            'duplicate clauses': self.duplicates_counter,
+            'lost clauses': self.lost_counter,
+        }
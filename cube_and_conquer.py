@@ -0,0 +1,238 @@
+from dimacs import open_input, get_file_suffix
+from instance_cache import load_instance, DEFAULT_CACHE_DIR
+from cdcl import CDCL_solver, RESTART_STRATEGIES, DELETION_STRATEGIES, DECISION_STRATEGIES, decode_assignment
+import multiprocessing
+import argparse
+import queue
+import time
+import sys
+
+parser = argparse.ArgumentParser()
+parser.add_argument('infile', nargs='?', type=open_input, default=sys.stdin)
+parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help="Directory with cached parsed instances")
+parser.add_argument('--no_cache', action='store_true', help="Always parse the input file")
+parser.add_argument('--restart', choices=RESTART_STRATEGIES, default='Luby')
+parser.add_argument('--deletion', choices=DELETION_STRATEGIES, default='tiered')
+parser.add_argument('--decision', choices=DECISION_STRATEGIES, default='VSIDS')
+parser.add_argument('--depth', type=int, default=4, help="Number of split decisions, at most 2^depth cubes are created")
+parser.add_argument('--candidates', type=int, default=30, help="Number of most frequent variables tried by lookahead")
+parser.add_argument('--workers', type=int, default=1, help="Number of processes solving the cubes")
+
+
+def propagate_cube(solver, cube):
+    """Assigns the cube literals on separate decision levels, returns False on a conflict"""
+    solver.backtrack(0)
+    if not solver.ok:
+        return False
+    if solver.unit_propagation() >= 0:
+        solver.ok = False
+        return False
+    for literal in cube:
+        value = solver.literal_value(literal)
+        if value < 0:
+            return False
+        if value == 0:
+            solver.decision_level += 1
+            solver.assign(literal, -1)
+            if solver.unit_propagation() >= 0:
+                return False
+    return True
+
+
+def lookahead(solver, cube, candidates):
+    """Returns the cube extended by failed literals and the best variable to split on
+
+    The score of a variable is the product of the numbers of literals propagated by its two polarities.
+    Returns (None, None) if the cube is refuted and a None variable if all candidates are assigned.
+    """
+    while True:
+        if not propagate_cube(solver, cube):
+            return None, None
+        level = solver.decision_level
+        size = len(solver.assignment)
+
+        best_var = None
+        best_score = -1
+        implied_literal = None
+        for var in candidates:
+            if solver.values[var] != 0:
+                continue
+            counts = []
+            for literal in [var, -var]:
+                solver.decision_level = level + 1
+                solver.assign(literal, -1)
+                conflict = solver.unit_propagation() >= 0
+                counts.append(None if conflict else len(solver.assignment) - size)
+                solver.backtrack(level)
+
+            if counts[0] is None and counts[1] is None:
+                return None, None
+            if counts[0] is None or counts[1] is None:
+                # failed literal, the opposite polarity is implied by the cube
+                implied_literal = -var if counts[0] is None else var
+                break
+            score = (counts[0] + 1) * (counts[1] + 1)
+            if score > best_score:
+                best_var = var
+                best_score = score
+
+        if implied_literal is None:
+            return cube, best_var
+        cube = cube + [implied_literal]
+
+
+def split(solver, cube, depth, candidates, cubes, statistics):
+    """Appends cubes of the subtree of the given cube to 'cubes' in depth-first order"""
+    cube, var = lookahead(solver, cube, candidates)
+    if cube is None:
+        statistics['cubes refuted by lookahead'] += 1
+        return
+    if depth == 0 or var is None:
+        cubes.append(cube)
+        return
+    split(solver, cube + [var], depth - 1, candidates, cubes, statistics)
+    split(solver, cube + [-var], depth - 1, candidates, cubes, statistics)
+
+
+def generate_cubes(clauses, depth, candidates_number=30):
+    """Returns list of cubes (lists of literals) covering all models of the clauses and statistics"""
+    start = time.time()
+    statistics = {'cubes refuted by lookahead': 0}
+    solver = CDCL_solver(clauses, None, None, 'most_common')
+
+    # short clauses get more weight, as in the Jeroslow-Wang heuristics
+    scores = dict()
+    for clause in clauses:
+        for l in clause:
+            scores[abs(l)] = scores.get(abs(l), 0) + 2 ** -len(clause)
+    candidates = sorted(scores, key=lambda var: -scores[var])[:candidates_number]
+
+    cubes = []
+    split(solver, [], depth, candidates, cubes, statistics)
+    statistics['cubes'] = len(cubes)
+    statistics['cube generation time'] = time.time() - start
+    return cubes, statistics
+
+
+def solve_cube(solver, cube_index, cube):
+    """Solves the formula of the solver under the cube, returns the answer with statistics"""
+    start = time.time()
+    decisions = solver.decisions_counter
+    unit_propagations = solver.unit_prop_counter
+    assignment = solver.solve(assumptions=cube)
+    statistics = {
+        'CPU time': time.time() - start,
+        'decisions': solver.decisions_counter - decisions,
+        'unit propagation steps': solver.unit_prop_counter - unit_propagations,
+    }
+    return cube_index, assignment, list(solver.failed_assumptions), statistics
+
+
+def cube_worker(clauses, configuration, tasks, results):
+    """Solves cubes from the 'tasks' queue until None is received, the solver keeps learned clauses between cubes"""
+    solver = CDCL_solver(clauses, *configuration)
+    for cube_index, cube in iter(tasks.get, None):
+        results.put(solve_cube(solver, cube_index, cube))
+
+
+def conquer(clauses, cubes, configuration, workers):
+    """Solves the cubes in worker processes, returns an assignment (None for UNSAT) and per-cube reports
+
+    Only as many cubes as there are workers are handed out at once, so cubes which are still queued
+    can be pruned by failed assumptions of refuted cubes. A report is a (cube, answer, statistics) tuple.
+    """
+    pending = list(range(len(cubes)))
+    reports = [None] * len(cubes)
+    running = 0
+    assignment = None
+
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=cube_worker, args=(clauses, configuration, tasks, results), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        while len(pending) > 0 or running > 0:
+            while running < workers and len(pending) > 0:
+                cube_index = pending.pop(0)
+                tasks.put((cube_index, cubes[cube_index]))
+                running += 1
+
+            try:
+                cube_index, cube_assignment, failed_assumptions, statistics = results.get(timeout=1)
+            except queue.Empty:
+                if not all(process.is_alive() for process in processes):
+                    raise RuntimeError("A cube worker exited unexpectedly")
+                continue
+            running -= 1
+
+            if cube_assignment is not None:
+                reports[cube_index] = (cubes[cube_index], 'SAT', statistics)
+                assignment = cube_assignment
+                break
+
+            # every queued cube containing the failed assumptions is refuted as well
+            reports[cube_index] = (cubes[cube_index], 'UNSAT', statistics)
+            failed_assumptions = set(failed_assumptions)
+            still_pending = []
+            for i in pending:
+                if failed_assumptions.issubset(cubes[i]):
+                    reports[i] = (cubes[i], 'pruned', dict())
+                else:
+                    still_pending.append(i)
+            pending = still_pending
+    finally:
+        # idle workers finish, the ones still solving a cube are cancelled
+        for _ in processes:
+            tasks.put(None)
+        tasks.cancel_join_thread()
+        for process in processes:
+            process.join(0.1)
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    return assignment, [report if report is not None else (cubes[i], 'cancelled', dict())
+                        for i, report in enumerate(reports)]
+
+
+def cube_and_conquer(clauses, configuration=('Luby', 'tiered', 'VSIDS'), depth=4, candidates_number=30, workers=1):
+    """Returns an assignment (None for UNSAT), per-cube reports and statistics of the cube generation"""
+    cubes, statistics = generate_cubes(clauses, depth, candidates_number)
+    start = time.time()
+    assignment, reports = conquer(clauses, cubes, configuration, max(1, workers))
+    statistics['conquer wall time'] = time.time() - start
+    statistics['pruned cubes'] = sum(1 for _, answer, _ in reports if answer == 'pruned')
+    return assignment, reports, statistics
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    file_suffix = get_file_suffix(args.infile.name)
+
+    if file_suffix not in ['sat', 'cnf']:
+        raise Exception("Unknown file type")
+    clauses, variables_mapping, _ = load_instance(args.infile, file_suffix, None if args.no_cache else args.cache_dir)
+
+    assignment, reports, statistics = cube_and_conquer(clauses, (args.restart, args.deletion, args.decision),
+                                                       max(0, args.depth), args.candidates, args.workers)
+
+    if assignment is None:
+        print('UNSAT')
+    else:
+        print('SAT')
+        print('satisfying assignment:')
+        print(decode_assignment(assignment, None if file_suffix == 'cnf' else variables_mapping))
+
+    print()
+    for name, value in statistics.items():
+        print(name + ':', "{:.2f}".format(value) if isinstance(value, float) else value)
+    print()
+    for i, (cube, answer, cube_statistics) in enumerate(reports):
+        line = 'cube ' + str(i) + ' ' + str(cube) + ': ' + answer
+        if 'CPU time' in cube_statistics:
+            line += ', {:.2f} s, {} decisions'.format(cube_statistics['CPU time'], cube_statistics['decisions'])
+        print(line)
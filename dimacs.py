@@ -0,0 +1,174 @@
+import sys
+import argparse
+import time
+import re
+import json
+import io
+import gzip
+import bz2
+import lzma
+import gc
+from contextlib import contextmanager
+from collections import Counter
+from itertools import chain
+
+COMPRESSION_OPENERS = {'gz': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+CHUNK_SIZE = 1 << 22    # number of characters read at once
+
+CLAUSE_END = re.compile(r'(?:^|\s)0(?=\s|$)')
+COMMENT_LINE = re.compile(r'^[ \t]*c.*$', re.MULTILINE)
+HEADER_LINE = re.compile(r'^[ \t]*p[ \t]+cnf[ \t]+(\d+)[ \t]+(\d+).*$', re.MULTILINE)
+TRAILER = re.compile(r'^[ \t]*%', re.MULTILINE)    # end of formula used in SATLIB files
+
+
+class CompressedInput(io.TextIOWrapper):
+    """Text stream of a compressed file which keeps the file name"""
+    def __init__(self, file_name, opener):
+        super().__init__(opener(file_name, 'rb'), encoding='UTF-8')
+        self.file_name = file_name
+
+    @property
+    def name(self):
+        return self.file_name
+
+
+def open_input(file_name):
+    """Opens a plain or compressed input file in text mode, usable as argparse type"""
+    if file_name == '-':
+        return sys.stdin
+    suffix = file_name.split('.')[-1]
+    if suffix in COMPRESSION_OPENERS:
+        return CompressedInput(file_name, COMPRESSION_OPENERS[suffix])
+    return open(file_name, 'r', encoding='UTF-8')
+
+
+@contextmanager
+def paused_garbage_collection():
+    """Cyclic garbage collection is useless while building millions of clause lists, which contain no cycles"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def get_file_suffix(file_name):
+    """Returns the suffix of the file name ignoring compression, e.g. 'cnf' for 'formula.cnf.gz'"""
+    parts = file_name.split('.')
+    if len(parts) > 2 and parts[-1] in COMPRESSION_OPENERS:
+        return parts[-2]
+    return parts[-1]
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('infile', nargs='?', type=open_input, default=sys.stdin)
+parser.add_argument('--top', type=int, default=10, help="Number of most frequent literals printed")
+
+
+def split_clauses(text):
+    """Returns clauses terminated by 0 in the text and the rest of the text"""
+    text = ' ' + text.replace('\n', ' ') + ' '
+    if '  ' in text or '\t' in text or '\r' in text:
+        text = ' ' + ' '.join(text.split()) + ' '
+    end = text.rfind(' 0 ')
+    if end < 0:
+        return [], text
+
+    if ' 0 0 ' not in text:
+        # the fast path converts the text to JSON which is parsed in C
+        try:
+            return json.loads('[[' + text[:end + 1].replace(' 0 ', '],[').strip().replace(' ', ',') + ']]'), text[end + 3:]
+        except ValueError:
+            pass
+
+    # empty clauses or unusual number formats
+    parts = CLAUSE_END.split(text)
+    rest = parts.pop()
+    return [list(map(int, part.split())) for part in parts], rest
+
+
+def read_clause_chunks(input, statistics=None):
+    """Yields lists of clauses parsed from consecutive chunks of free-form DIMACS input
+
+    Clauses may span several lines, comments may occur anywhere and a line starting with '%' ends the formula.
+    """
+    rest = ''       # text after the last newline of the previous chunk
+    body = ''       # literals of a clause which is not terminated yet
+    finished = False
+    while not finished:
+        chunk = input.read(CHUNK_SIZE)
+        if chunk:
+            text = rest + chunk
+            cut = text.rfind('\n') + 1
+            if cut == 0:
+                rest = text
+                continue
+            text, rest = text[:cut], text[cut:]
+        else:
+            text, rest = rest + '\n', ''
+            finished = True
+
+        if 'p' in text:
+            header = HEADER_LINE.search(text)
+            if header is not None:
+                if statistics is not None:
+                    statistics['header variables'] = int(header.group(1))
+                    statistics['header clauses'] = int(header.group(2))
+                text = HEADER_LINE.sub('', text)
+        if 'c' in text:
+            text = COMMENT_LINE.sub('', text)
+        if '%' in text:
+            trailer = TRAILER.search(text)
+            if trailer is not None:
+                text = text[:trailer.start()]
+                finished = True
+
+        clauses, body = split_clauses(body + text)
+        yield clauses
+
+    if body.strip():
+        # the last clause is not terminated by 0
+        yield [list(map(int, body.split()))]
+
+
+def load_dimacs(input, statistics=None):
+    """Returns list of clauses, variable, clause and literal occurrence counts are stored in 'statistics' if given"""
+    clauses = []
+    if statistics is None:
+        with paused_garbage_collection():
+            for chunk_clauses in read_clause_chunks(input):
+                clauses.extend(chunk_clauses)
+        return clauses
+
+    occurrences = Counter()
+    literals_number = 0
+    with paused_garbage_collection():
+        for chunk_clauses in read_clause_chunks(input, statistics):
+            clauses.extend(chunk_clauses)
+            occurrences.update(chain.from_iterable(chunk_clauses))
+            literals_number += sum(map(len, chunk_clauses))
+
+    statistics['variables'] = max(map(abs, occurrences), default=0)
+    statistics['clauses'] = len(clauses)
+    statistics['literals'] = literals_number
+    statistics['occurrences'] = occurrences
+    return clauses
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    statistics = dict()
+    start = time.time()
+    load_dimacs(args.infile, statistics)
+    end = time.time()
+
+    if 'header variables' in statistics:
+        print('header:', statistics['header variables'], 'variables,', statistics['header clauses'], 'clauses')
+    print('number of variables:', statistics['variables'])
+    print('number of clauses:', statistics['clauses'])
+    print('number of literals:', statistics['literals'])
+    print('most frequent literals:', statistics['occurrences'].most_common(args.top))
+    print('parsing time:', "{:.2f}".format(end - start))
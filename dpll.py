@@ -1,54 +1,130 @@
 import sys
 import argparse
+import signal
 import time
-from formula2cnf import load_smtlib
+from dimacs import open_input, get_file_suffix
+from instance_cache import load_instance, DEFAULT_CACHE_DIR
+from preprocessing import Preprocessor, add_preprocessing_arguments
+from instrumentation import Instrumentation, add_instrumentation_arguments, write_statistics
+from budget import Budget, UNKNOWN, add_budget_arguments
 
+DECISION_HEURISTICS = ['shortest', 'MOMs', 'Jeroslow-Wang', 'DLIS']
 
 parser = argparse.ArgumentParser()
-parser.add_argument('infile', nargs='?', type=argparse.FileType('r', encoding='UTF-8'), default=sys.stdin)
-parser.add_argument('--decision_heuristics', type=bool, default=False)
+parser.add_argument('infile', nargs='?', type=open_input, default=sys.stdin)
+parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help="Directory with cached parsed instances")
+parser.add_argument('--no_cache', action='store_true', help="Always parse the input file")
+parser.add_argument('--decision_heuristics', choices=DECISION_HEURISTICS, default=None,
+                    help="Branching heuristics, the first unassigned literal is decided by default")
+add_preprocessing_arguments(parser)
+add_instrumentation_arguments(parser, conflicts=False)
+add_budget_arguments(parser)
+
+# search statistics, reset by the caller before each run
+unit_prop_counter = 0
+decisions_counter = 0
+checked_clauses_counter = 0
+conflicts_counter = 0
+
+
+class ClauseIndex:
+    """Buckets of unsatisfied clauses by their number of unassigned literals and occurrences of literals in them
+
+    The index is updated by unit propagation and backtracking, so the branching heuristics do not have
+    to scan the clauses. Occurrences are counted for all literals of unsatisfied clauses, the heuristics
+    skip the assigned ones.
+    """
+    def __init__(self, clauses, satisfied_clauses, unass_literals_counter):
+        self.clauses = clauses
+        self.buckets = [set() for _ in range(max((len(clause) for clause in clauses), default=0) + 1)]
+        self.occurrences = dict()           # numbers of unsatisfied clauses containing the literal
+        self.weights = dict()               # Jeroslow-Wang scores, sums of 2^-length over unsatisfied clauses
+        for clause in clauses:
+            for lit in clause:
+                self.occurrences[lit] = 0
+                self.occurrences[-lit] = 0
+                self.weights[lit] = 0.0
+                self.weights[-lit] = 0.0
+        for clause_index, clause in enumerate(clauses):
+            if not satisfied_clauses[clause_index]:
+                self.unsatisfy(clause_index, len(clause) - unass_literals_counter[clause_index])
+
+    def satisfy(self, clause_index, unassigned_literals_number):
+        self.buckets[unassigned_literals_number].discard(clause_index)
+        clause = self.clauses[clause_index]
+        for lit in clause:
+            self.occurrences[lit] -= 1
+            self.weights[lit] -= 2.0 ** -len(clause)
+
+    def unsatisfy(self, clause_index, unassigned_literals_number):
+        self.buckets[unassigned_literals_number].add(clause_index)
+        clause = self.clauses[clause_index]
+        for lit in clause:
+            self.occurrences[lit] += 1
+            self.weights[lit] += 2.0 ** -len(clause)
+
+    def move(self, clause_index, old_number, new_number):
+        """Moves an unsatisfied clause whose number of unassigned literals changed"""
+        self.buckets[old_number].discard(clause_index)
+        self.buckets[new_number].add(clause_index)
+
+    def get_shortest_clauses(self):
+        for bucket in self.buckets[1:]:
+            if len(bucket) > 0:
+                return bucket
+        return None
 
 
-def decide_literal_heuristics(clauses, satisfied_clauses):
+def decide_literal_heuristics(heuristics, index, assigned_literals):
+    """Returns an unassigned literal chosen by the heuristics or None if all clauses are satisfied"""
+    shortest_clauses = index.get_shortest_clauses()
+    if shortest_clauses is None:
+        return None
     global decisions_counter
     decisions_counter += 1
 
-    literal = None
-    min_clause_length = len(clauses[0])
-    for i, clause in enumerate(clauses):
-        if not satisfied_clauses[i]:
-            if len(clause) == 2:
-                #  immediately returning a literal located in a clause of length 2
-                return clause[0]
-            if len(clause) <= min_clause_length:
-                #  finding a literal located in the shortest clause
-                literal = clause[0]
-                min_clause_length = len(clause)
-    return literal
-
-
-def decide_literal(assignment, adjacency_list):
+    if heuristics == 'shortest':
+        # the first unassigned literal of a shortest clause
+        for lit in index.clauses[min(shortest_clauses)]:
+            if lit not in assigned_literals and -lit not in assigned_literals:
+                return lit
+
+    if heuristics == 'MOMs':
+        # maximum occurrences in clauses of minimum size, both polarities of a variable are rewarded
+        counts = dict()
+        for i in shortest_clauses:
+            for lit in index.clauses[i]:
+                if lit not in assigned_literals and -lit not in assigned_literals:
+                    counts[lit] = counts.get(lit, 0) + 1
+        best_literal = None
+        best_score = -1
+        for var in sorted(set(abs(lit) for lit in counts)):
+            positive, negative = counts.get(var, 0), counts.get(-var, 0)
+            score = (positive + negative) * 1024 + positive * negative
+            if score > best_score:
+                best_literal = var if positive >= negative else -var
+                best_score = score
+        return best_literal
+
+    # Jeroslow-Wang or DLIS (dynamic largest individual sum)
+    scores = index.weights if heuristics == 'Jeroslow-Wang' else index.occurrences
+    best_literal = None
+    for lit, score in scores.items():
+        if lit not in assigned_literals and -lit not in assigned_literals:
+            if best_literal is None or score > scores[best_literal]:
+                best_literal = lit
+    return best_literal
+
+
+def decide_literal(assigned_literals, adjacency_list):
     for literal in adjacency_list.keys():
-        if literal not in assignment and -literal not in assignment:
+        if literal not in assigned_literals and -literal not in assigned_literals:
             global decisions_counter
             decisions_counter += 1
             return literal
     return None
 
 
-def load_dimacs(input):
-    line = input.readline()
-    while line[0] == 'c':
-        line = input.readline()
-    _, _, nbvar, nbclauses = line.split()
-
-    clauses = []
-    for i in range(int(nbclauses)):
-        clause = [int(var) for var in input.readline().split() if var != '0']
-        clauses.append(clause)
-    return clauses
-
-
 def get_adjacency_list(clauses):
     ad_list = dict()
     # initialization of lists
@@ -66,13 +142,17 @@ def get_adjacency_list(clauses):
     return ad_list
 
 
-def unit_prop(literal, clauses, adjacency_list, satisfied_clauses, assignment, unass_literals_counter):
-    """Unit propagate given literal"""
+def unit_prop(literal, clauses, adjacency_list, satisfied_clauses, satisfied_trail, assignment, assigned_literals, unass_literals_counter, index=None):
+    """Unit propagate given literal, newly satisfied clauses are put on 'satisfied_trail'
+
+    The ClauseIndex of the branching heuristics is updated if given.
+    """
 
     global checked_clauses_counter
     global unit_prop_counter
     unit_prop_counter += 1
     assignment.append(literal)
+    assigned_literals.add(literal)
 
     # satisfying clauses containing the literal
     for clause_index in adjacency_list[literal]:
@@ -80,6 +160,9 @@ def unit_prop(literal, clauses, adjacency_list, satisfied_clauses, assignment, u
 
         if not satisfied_clauses[clause_index]:
             satisfied_clauses[clause_index] = True
+            satisfied_trail.append(clause_index)
+            if index is not None:
+                index.satisfy(clause_index, len(clauses[clause_index]) - unass_literals_counter[clause_index])
 
     # adjusting clauses containing literal negation
     found_unit_literals = set()
@@ -89,11 +172,13 @@ def unit_prop(literal, clauses, adjacency_list, satisfied_clauses, assignment, u
 
         unass_literals_counter[clause_index] += 1
         unassigned_literals_number = len(clauses[clause_index]) - unass_literals_counter[clause_index]
+        if index is not None and not satisfied_clauses[clause_index]:
+            index.move(clause_index, unassigned_literals_number + 1, unassigned_literals_number)
         if unassigned_literals_number == 0:
             unsat = True
         elif unassigned_literals_number == 1:
             for lit in clauses[clause_index]:
-                if -lit not in assignment and lit not in assignment:
+                if -lit not in assigned_literals and lit not in assigned_literals:
                     found_unit_literals.add(lit)
 
     if unsat:
@@ -102,70 +187,129 @@ def unit_prop(literal, clauses, adjacency_list, satisfied_clauses, assignment, u
         return found_unit_literals
 
 
-def dpll(clauses, adjacency_list, satisfied_clauses, assignment, unass_literals_counter, literals_to_satisfy=None, heuristics=False):
-    # unit propagation
-    while len(literals_to_satisfy) > 0:
-        result = unit_prop(literals_to_satisfy.pop(), clauses, adjacency_list, satisfied_clauses, assignment, unass_literals_counter)
-        if result is None:
-            return None
-        else:
-            literals_to_satisfy = literals_to_satisfy.union(result)
-
+def dpll(clauses, adjacency_list, satisfied_clauses, assignment, unass_literals_counter, literals_to_satisfy=None, heuristics=None,
+         budget=None):
+    """Returns a satisfying assignment, None or UNKNOWN, 'heuristics' is one of DECISION_HEURISTICS or None
 
-    if heuristics:
-        current_literal = decide_literal_heuristics(clauses, satisfied_clauses)
+    The search is iterative, every decision point on the stack remembers the trail position of its literal
+    and the number of satisfied clauses, so backtracking undoes both incrementally. A search stopped by the
+    budget keeps its state in the budget, calling dpll again with the same arguments continues it.
+    """
+    global conflicts_counter
+    assigned_literals = set(assignment)
+    if budget is not None and budget.resume_state is not None:
+        decisions, satisfied_trail, literals_to_satisfy, index = budget.resume_state
+        budget.resume_state = None
     else:
-        current_literal = decide_literal(assignment, adjacency_list)
-    if current_literal is None:
-        return assignment
-
-    original_sat_clauses = satisfied_clauses[:]
+        satisfied_trail = []    # indices of satisfied clauses in the order of satisfying
+        decisions = []          # stack of [decision literal, trail position, satisfied trail length, negated branch flag]
+        index = None if heuristics is None else ClauseIndex(clauses, satisfied_clauses, unass_literals_counter)
+        if literals_to_satisfy is None:
+            literals_to_satisfy = set()
+    if budget is not None:
+        budget.start(conflicts_counter, unit_prop_counter)
+
+    while True:
+        # unit propagation
+        conflict = False
+        while len(literals_to_satisfy) > 0:
+            if budget is not None and unit_prop_counter >= budget.next_check and budget.is_exhausted(unit_prop_counter):
+                budget.resume_state = (decisions, satisfied_trail, literals_to_satisfy, index)
+                return UNKNOWN
+            result = unit_prop(literals_to_satisfy.pop(), clauses, adjacency_list, satisfied_clauses, satisfied_trail,
+                               assignment, assigned_literals, unass_literals_counter, index)
+            if result is None:
+                conflict = True
+                break
+            else:
+                literals_to_satisfy = literals_to_satisfy.union(result)
+
+        if not conflict:
+            if heuristics is not None:
+                current_literal = decide_literal_heuristics(heuristics, index, assigned_literals)
+            else:
+                current_literal = decide_literal(assigned_literals, adjacency_list)
+            if current_literal is None:
+                return assignment
+
+            decisions.append([current_literal, len(assignment), len(satisfied_trail), False])
+            literals_to_satisfy = {current_literal}
+            continue
+
+        conflicts_counter += 1
+        # decisions whose both branches failed are left
+        while len(decisions) > 0 and decisions[-1][3]:
+            decisions.pop()
+        if len(decisions) == 0:
+            return None
 
-    result = dpll(clauses, adjacency_list, satisfied_clauses, assignment, unass_literals_counter, {current_literal}, heuristics)
-    if result is None:
         #  backtracking
-        index_of_current_literal = assignment.index(current_literal)
-        literals_to_backtrack = assignment[index_of_current_literal:]
-        for l in literals_to_backtrack:
-            assignment.pop()
+        current_literal, trail_position, satisfied_position, _ = decisions[-1]
+        decisions[-1][3] = True
+        while len(assignment) > trail_position:
+            l = assignment.pop()
+            assigned_literals.discard(l)
             for clause_index in adjacency_list[-l]:
                 unass_literals_counter[clause_index] -= 1
-    else:
-        return result
-
-    result = dpll(clauses, adjacency_list, original_sat_clauses, assignment, unass_literals_counter, {-current_literal}, heuristics)
+                if index is not None and not satisfied_clauses[clause_index]:
+                    unassigned_literals_number = len(clauses[clause_index]) - unass_literals_counter[clause_index]
+                    index.move(clause_index, unassigned_literals_number - 1, unassigned_literals_number)
+        while len(satisfied_trail) > satisfied_position:
+            clause_index = satisfied_trail.pop()
+            satisfied_clauses[clause_index] = False
+            if index is not None:
+                index.unsatisfy(clause_index, len(clauses[clause_index]) - unass_literals_counter[clause_index])
 
-    if result is None:
-        return None
-    else:
-        return result
+        literals_to_satisfy = {-current_literal}
+        if budget is not None and conflicts_counter >= budget.conflict_limit:
+            budget.resume_state = (decisions, satisfied_trail, literals_to_satisfy, index)
+            return UNKNOWN
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
 
-    file_suffix = args.infile.name.split('.')[-1]
+    file_suffix = get_file_suffix(args.infile.name)
 
-    if file_suffix == 'sat':
-        clauses, variables_mapping = load_smtlib(args.infile)
-    elif file_suffix == 'cnf':
-        clauses = load_dimacs(args.infile)
-    else:
+    if file_suffix not in ['sat', 'cnf']:
         raise Exception("Unknown file type")
-
-    adjacency_list = get_adjacency_list(clauses)
-    unit_literals = set([clause[0] for clause in clauses if len(clause) == 1])
-    unass_literals_counter = [0 for _ in clauses]
+    instrumentation = Instrumentation()
+    with instrumentation.measure('parse'):
+        clauses, variables_mapping, _ = load_instance(args.infile, file_suffix, None if args.no_cache else args.cache_dir)
+    if args.preprocess:
+        with instrumentation.measure('preprocess'):
+            preprocessor = Preprocessor(clauses, args.preprocess_time, args.preprocess_growth)
+            clauses = preprocessor.get_clauses()
+
+    with instrumentation.measure('init'):
+        adjacency_list = get_adjacency_list(clauses)
+        unit_literals = set([clause[0] for clause in clauses if len(clause) == 1])
+        unass_literals_counter = [0 for _ in clauses]
 
     unit_prop_counter = 0
     decisions_counter = 0
     checked_clauses_counter = 0
+    conflicts_counter = 0
 
+    if args.stats is not None:
+        instrumentation.attach_dpll(sys.modules[__name__])
+
+    budget = Budget(args.conflict_budget, args.propagation_budget, args.time_budget)
+    # Ctrl-C stops the search with UNKNOWN and the statistics are printed
+    signal.signal(signal.SIGINT, lambda signum, frame: budget.interrupt())
     start = time.time()
-    assignment = dpll(clauses, adjacency_list, [False for i in clauses], [], unass_literals_counter, literals_to_satisfy=unit_literals, heuristics=args.decision_heuristics)
+    with instrumentation.measure('search'):
+        assignment = dpll(clauses, adjacency_list, [False for i in clauses], [], unass_literals_counter, literals_to_satisfy=unit_literals, heuristics=args.decision_heuristics,
+                          budget=budget)
     end = time.time()
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    if args.preprocess and assignment is not None and assignment != UNKNOWN:
+        assignment = preprocessor.extend_model(assignment)
 
-    if assignment is None:
+    if assignment == UNKNOWN:
+        print('UNKNOWN')
+    elif assignment is None:
         print('UNSAT')
     else:
         print('SAT')
@@ -180,9 +324,11 @@ if __name__ == "__main__":
     print()
     print('CPU time:', end - start)
     print('number of decisions:', decisions_counter)
+    print('number of conflicts:', conflicts_counter)
     print('number of steps of unit propagation:', unit_prop_counter)
     print('total number of checked clauses:', checked_clauses_counter)
-
-
-
-
+    if args.preprocess:
+        for name, value in preprocessor.get_statistics().items():
+            print(name + ':', "{:.2f}".format(value) if isinstance(value, float) else value)
+    if args.stats is not None:
+        write_statistics(instrumentation.get_statistics(), args.stats)
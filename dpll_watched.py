@@ -2,16 +2,27 @@ import sys
 import argparse
 import time
 
-from formula2cnf import load_smtlib
-from dpll import load_dimacs
+from dimacs import open_input, get_file_suffix
+from instance_cache import load_instance, DEFAULT_CACHE_DIR
+from preprocessing import Preprocessor, add_preprocessing_arguments
+from instrumentation import Instrumentation, add_instrumentation_arguments, write_statistics
 
 parser = argparse.ArgumentParser()
-parser.add_argument('infile', nargs='?', type=argparse.FileType('r', encoding='UTF-8'), default=sys.stdin)
+parser.add_argument('infile', nargs='?', type=open_input, default=sys.stdin)
+parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help="Directory with cached parsed instances")
+parser.add_argument('--no_cache', action='store_true', help="Always parse the input file")
+add_preprocessing_arguments(parser)
+add_instrumentation_arguments(parser, conflicts=False)
 
+# search statistics, reset by the caller before each run
+unit_prop_counter = 0
+decisions_counter = 0
+checked_clauses_counter = 0
 
-def decide_literal(assignment, watched_literals):
+
+def decide_literal(assigned_literals, watched_literals):
     for literal in watched_literals.keys():
-        if literal not in assignment and -literal not in assignment:
+        if literal not in assigned_literals and -literal not in assigned_literals:
             global decisions_counter
             decisions_counter += 1
             return literal
@@ -19,76 +30,89 @@ def decide_literal(assignment, watched_literals):
 
 
 def get_watched_literals(clauses):
+    """Returns copies of the clauses, their watch lists and literals of unit clauses
+
+    Literals at positions 0 and 1 of a clause are watched, a watch list of a literal contains
+    (clause index, blocker literal) pairs where the blocker is another literal of the clause.
+    The search reorders literals of the returned copies, the given clauses are not changed.
+    Repeated literals are removed from the copies, so the two watches are different literals.
+    """
     w_lits = dict()
     unit_literals = set()
+    clauses = [list(dict.fromkeys(clause)) for clause in clauses]
 
-    for i, clause in enumerate(clauses):
+    for clause in clauses:
         for literal in clause:
             if literal not in w_lits:
-                w_lits[literal] = set()
+                w_lits[literal] = []
             if -literal not in w_lits:
-                w_lits[-literal] = set()
+                w_lits[-literal] = []
 
     for i, clause in enumerate(clauses):
-        w_lits[clause[0]].add(i)
         if len(clause) >= 2:
-            w_lits[clause[1]].add(i)
+            w_lits[clause[0]].append((i, clause[1]))
+            w_lits[clause[1]].append((i, clause[0]))
         elif len(clause) == 1:
+            w_lits[clause[0]].append((i, clause[0]))
             unit_literals.add(clause[0])
 
-    return w_lits, unit_literals
+    return clauses, w_lits, unit_literals
 
 
-def unit_prop(literal, clauses, watched_literals, assignment):
+def unit_prop(literal, clauses, watched_literals, assignment, assigned_literals):
     """Unit propagate given literal"""
 
     global unit_prop_counter
     global checked_clauses_counter
     unit_prop_counter += 1
     assignment.append(literal)
+    assigned_literals.add(literal)
 
     # trying to change watched literals in clauses where 'not literal' is watched
     found_unit_literals = set()
-    not_longer_watched = list()
+    watches = watched_literals[-literal]
+    kept_watches = []
 
     unsat = False
-    for clause_index in watched_literals[-literal]:
+    for watch_index, (clause_index, blocker) in enumerate(watches):
         checked_clauses_counter += 1
-        next_watched_literal = None
-        possible_unit_literal = None
-        possible_unit_literal_satisfied = None
-
-        if len(clauses[clause_index]) == 1:
-            unsat = True
+        if blocker in assigned_literals:
+            # the clause is satisfied, it does not have to be visited
+            kept_watches.append((clause_index, blocker))
             continue
 
-        neg_literal_offset = clauses[clause_index].index(-literal)
-        for i in range(neg_literal_offset + 1, neg_literal_offset + len(clauses[clause_index])):
-            l = clauses[clause_index][i % len(clauses[clause_index])]
-            if clause_index in watched_literals[l]:
-                # 'l' is another watched literal in this clause
-                possible_unit_literal = l
-                if possible_unit_literal in assignment:
-                    possible_unit_literal_satisfied = True
-                if -possible_unit_literal in assignment:
-                    possible_unit_literal_satisfied = False
-            else:
-                if not next_watched_literal and -l not in assignment:
-                    next_watched_literal = l
-
-        if next_watched_literal is None:
-            # watched 'literal' cannot move in this clause
-            if possible_unit_literal_satisfied is None:
-                found_unit_literals.add(possible_unit_literal)
-            elif not possible_unit_literal_satisfied:
-                unsat = True
-        else:
-            not_longer_watched.append(clause_index)
-            watched_literals[next_watched_literal].add(clause_index)
-
-
-    for clause_index in not_longer_watched:
-        watched_literals[-literal].remove(clause_index)
+        clause = clauses[clause_index]
+        if len(clause) > 1:
+            # the false literal is moved to position 1, the other watched literal is at position 0
+            if clause[0] == -literal:
+                clause[0], clause[1] = clause[1], clause[0]
+            other_watched_literal = clause[0]
+            if other_watched_literal in assigned_literals:
+                kept_watches.append((clause_index, other_watched_literal))
+                continue
+
+            new_watch_position = None
+            for i in range(2, len(clause)):
+                if -clause[i] not in assigned_literals:
+                    new_watch_position = i
+                    break
+            if new_watch_position is not None:
+                clause[1], clause[new_watch_position] = clause[new_watch_position], clause[1]
+                watched_literals[clause[1]].append((clause_index, other_watched_literal))
+                continue
+
+            if -other_watched_literal not in assigned_literals:
+                # watched 'literal' cannot move in this clause
+                kept_watches.append((clause_index, other_watched_literal))
+                found_unit_literals.add(other_watched_literal)
+                continue
+
+        # all literals of the clause are false, the remaining watches are kept
+        unsat = True
+        kept_watches.extend(watches[watch_index:])
+        break
+
+    watched_literals[-literal] = kept_watches
 
     if unsat:
         return None
@@ -96,34 +120,36 @@ def unit_prop(literal, clauses, watched_literals, assignment):
         return found_unit_literals
 
 
-def dpll_watched(clauses, watched_literals, assignment, literals_to_satisfy):
+def dpll_watched(clauses, watched_literals, assignment, literals_to_satisfy, assigned_literals=None):
+    if assigned_literals is None:
+        assigned_literals = set(assignment)
+
     # unit propagation
     while len(literals_to_satisfy) > 0:
-        result = unit_prop(literals_to_satisfy.pop(), clauses, watched_literals, assignment)
+        result = unit_prop(literals_to_satisfy.pop(), clauses, watched_literals, assignment, assigned_literals)
         if result is None:
             return None
         else:
             literals_to_satisfy = literals_to_satisfy.union(result)
 
 
-    current_literal = decide_literal(assignment, watched_literals)
+    current_literal = decide_literal(assigned_literals, watched_literals)
     if current_literal == None:
         # all variables assigned
         return assignment
 
 
-    result = dpll_watched(clauses, watched_literals, assignment, {current_literal})
+    index_of_current_literal = len(assignment)
+    result = dpll_watched(clauses, watched_literals, assignment, {current_literal}, assigned_literals)
     if result is None:
         #  backtracking
-        index_of_current_literal = assignment.index(current_literal)
-        literals_to_backtrack = assignment[index_of_current_literal:]
-        for _ in literals_to_backtrack:
-            assignment.pop()
+        while len(assignment) > index_of_current_literal:
+            assigned_literals.discard(assignment.pop())
     else:
         return result
 
 
-    result = dpll_watched(clauses, watched_literals, assignment, {-current_literal})
+    result = dpll_watched(clauses, watched_literals, assignment, {-current_literal}, assigned_literals)
     if result is None:
         return None
     else:
@@ -133,25 +159,36 @@ def dpll_watched(clauses, watched_literals, assignment, literals_to_satisfy):
 if __name__ == "__main__":
     args = parser.parse_args()
 
-    file_suffix = args.infile.name.split('.')[-1]
+    file_suffix = get_file_suffix(args.infile.name)
 
-    if file_suffix == 'sat':
-        clauses, variables_mapping = load_smtlib(args.infile)
-    elif file_suffix == 'cnf':
-        clauses = load_dimacs(args.infile)
-    else:
+    if file_suffix not in ['sat', 'cnf']:
         raise Exception("Unknown file type")
+    instrumentation = Instrumentation()
+    with instrumentation.measure('parse'):
+        clauses, variables_mapping, _ = load_instance(args.infile, file_suffix, None if args.no_cache else args.cache_dir)
+    if args.preprocess:
+        with instrumentation.measure('preprocess'):
+            preprocessor = Preprocessor(clauses, args.preprocess_time, args.preprocess_growth)
+            clauses = preprocessor.get_clauses()
 
-    watched_literals, literals_to_satisfy = get_watched_literals(clauses)
+    with instrumentation.measure('init'):
+        clauses, watched_literals, literals_to_satisfy = get_watched_literals(clauses)
 
     unit_prop_counter = 0
     decisions_counter = 0
     checked_clauses_counter = 0
 
+    if args.stats is not None:
+        instrumentation.attach_dpll(sys.modules[__name__])
+
     start = time.time()
-    assignment = dpll_watched(clauses, watched_literals, [], literals_to_satisfy)
+    with instrumentation.measure('search'):
+        assignment = dpll_watched(clauses, watched_literals, [], literals_to_satisfy)
     end = time.time()
 
+    if args.preprocess and assignment is not None:
+        assignment = preprocessor.extend_model(assignment)
+
     if assignment is None:
         print('UNSAT')
     else:
@@ -168,4 +205,9 @@ if __name__ == "__main__":
     print('CPU time:', end - start)
     print('number of decisions:', decisions_counter)
     print('number of steps of unit propagation:', unit_prop_counter)
-    print('total number of checked clauses:', checked_clauses_counter)
\ No newline at end of file
+    print('total number of checked clauses:', checked_clauses_counter)
+    if args.preprocess:
+        for name, value in preprocessor.get_statistics().items():
+            print(name + ':', "{:.2f}".format(value) if isinstance(value, float) else value)
+    if args.stats is not None:
+        write_statistics(instrumentation.get_statistics(), args.stats)
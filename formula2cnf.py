@@ -1,28 +1,44 @@
 import sys
 import argparse
+import shutil
+import tempfile
 
 parser = argparse.ArgumentParser()
 parser.add_argument('infile', nargs='?', type=argparse.FileType('r', encoding='UTF-8'), default=sys.stdin)
 parser.add_argument('outfile', nargs='?', type=argparse.FileType('w', encoding='UTF-8'), default=sys.stdout)
-parser.add_argument("--implications_only", default=False, type=bool, help="Use only left-to-right implications")
+parser.add_argument("--implications_only", default=False, type=bool,
+                    help="Plaisted-Greenbaum encoding, only implications required by polarities of subformulas")
+parser.add_argument('--no_hashing', action='store_true', help="Encode identical subformulas by separate variables")
 
+ENCODING_VERSION = 3    # changes whenever the same formula is encoded differently, e.g. by variable numbering
+CHUNK_SIZE = 1 << 20    # number of characters read at once
 
-class Node:
-    """Node in a binary tree"""
-    def __init__(self, operation, variable, left, right):
-        self.operation = operation
-        self.var = variable
-        self.left = left
-        self.right = right
+OPERATIONS = ['not', 'and', 'or', '=>', 'xor', '=', 'ite']
+MIN_OPERANDS = {'not': 1, 'and': 1, 'or': 1, '=>': 1, 'xor': 1, '=': 2, 'ite': 3}
+MAX_OPERANDS = {'not': 1, 'ite': 3}
+
+# polarities of subformulas, i.e. which implications between a node and its variable are needed
+POSITIVE = 1
+NEGATIVE = 2
+BOTH = POSITIVE | NEGATIVE
 
 
 def get_tokens(input):
-    for line in input:
-        for token in line.translate({ord('('): ' ', ord(')'): ' '}).split():
-            yield token
+    """Yields tokens of the input including parentheses, the input is read in chunks, so a formula on a single line may be huge"""
+    rest = ''
+    while True:
+        chunk = input.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        tokens = (rest + chunk).translate({ord('('): ' ( ', ord(')'): ' ) '}).split()
+        # the last token may continue in the next chunk
+        rest = '' if chunk[-1].isspace() or chunk[-1] in '()' else tokens.pop()
+        yield from tokens
+    if rest:
+        yield rest
 
 
-def get_variable_node(variable_string, variables, negation=False):
+def get_variable(variable_string, variables, negation=False):
     if not (variable_string.isalnum() and variable_string[0].isalpha()):
         raise Exception("Wrong name of variable '" + variable_string + "'")
 
@@ -33,62 +49,266 @@ def get_variable_node(variable_string, variables, negation=False):
         variables[variable_string] = var_id
     if negation:
         var_id = -var_id
-    return Node(None, var_id, None, None)
-
-
-def load_formula(tokens, variables):
-    token = next(tokens)
-
-    if token == "not":
-        result = get_variable_node(next(tokens), variables, negation=True)
-    elif token in ["and", "or"]:
-        new_var_id = len(variables) + 1          # variable id of given node
-        variables[str(new_var_id)] = new_var_id  # auxiliary item for correct dictionary length
-        result = Node(
-            operation=token,
-            variable=new_var_id,
-            left=load_formula(tokens, variables),
-            right=load_formula(tokens, variables)
-        )
-    else:
-        result = get_variable_node(token, variables)
-    return result
+    return var_id
 
 
-def extract_clauses(node, implications_only, clauses_list):
-    if node.operation is None:
-        return
+def new_auxiliary_variable(variables):
+    var_id = len(variables) + 1
+    variables[str(var_id)] = var_id     # auxiliary item for correct dictionary length
+    return var_id
 
-    if node.operation == 'or':
-        if node.left.var != -node.right.var:                # avoiding 'True' clause
-            clauses_list.append([-node.var, node.left.var, node.right.var])
-    else:
-        clauses_list.append([-node.var, node.left.var])
-        clauses_list.append([-node.var, node.right.var])
 
-    if not implications_only:
-        if node.operation == 'or':
-            clauses_list.append([-node.left.var, node.var])
-            clauses_list.append([-node.right.var, node.var])
+def flip(polarity):
+    """Returns the polarity of a negated subformula"""
+    return ((polarity & POSITIVE) << 1) | ((polarity & NEGATIVE) >> 1)
+
+
+class TseitinEncoder:
+    """Iterative Tseitin encoding of a formula given by tokens, variable ids are stored in 'variables'
+
+    The formula is parsed with a stack of unfinished operations, so its depth is not limited. Nested
+    'and'/'or' chains are flattened and every operation gets a node over literals of its operands:
+    'and', 'or', binary 'xor' or 'ite'. Identical nodes get the same variable if 'hashing' is on.
+
+    Clauses of a node are split into the positive half (variable implies the node) and the negative
+    half (node implies variable). With Plaisted-Greenbaum encoding ('implications_only') only halves
+    required by the polarities of occurrences of the node are emitted, otherwise both halves always are.
+    A node whose polarity is not known yet when it is complete (an operand of '=>') is required later
+    by its parent. The root operation gets variable 1 if it is not negated.
+    """
+    def __init__(self, variables, implications_only=False, hashing=True):
+        self.variables = variables
+        self.hashing = hashing
+        self.root_polarity = POSITIVE if implications_only else BOTH
+        self.nodes = dict()         # (operation, operands...) -> variable of the node
+        self.definitions = dict()   # variable of a node -> (operation, operands...)
+        self.emitted = dict()       # variable of a node -> polarities whose clauses were emitted
+        self.root = None            # literal of the whole formula
+
+    def encode(self, tokens):
+        """Yields lists of clauses as soon as they are known"""
+        tokens = iter(tokens)
+        stack = []      # [operation, variable or None, operands, polarity] of unfinished operations
+        for token in tokens:
+            if token == '(':
+                operation = next(tokens, None)
+                if operation not in OPERATIONS:
+                    raise Exception("Unknown operation '" + str(operation) + "'")
+                polarity = self.root_polarity if len(stack) == 0 else self.get_operand_polarity(stack[-1])
+                # the root variable is known in advance, variables of other nodes are created when they are complete
+                var = new_auxiliary_variable(self.variables) if operation != 'not' and len(self.variables) == 0 else None
+                stack.append([operation, var, [], polarity])
+                continue
+
+            if token == ')':
+                if len(stack) == 0:
+                    raise Exception("Unexpected ')'")
+                operation, var, operands, polarity = stack.pop()
+                if operation in ['and', 'or'] and len(stack) > 0 and stack[-1][0] == operation and len(operands) > 0:
+                    # associative chain, the operands belong to the parent, the shorter list is copied
+                    # because nodes sort their operands anyway
+                    if len(operands) > len(stack[-1][2]):
+                        operands, stack[-1][2] = stack[-1][2], operands
+                    stack[-1][2].extend(operands)
+                    continue
+                literal = yield from self.complete(operation, operands, polarity, var)
+                # the literal may be an operand whose polarity was not known
+                yield from self.require(literal, polarity)
+            else:
+                literal = get_variable(token, self.variables)
+
+            if len(stack) == 0:
+                self.root = literal
+                return
+            stack[-1][2].append(literal)
+
+        raise Exception("Unexpected end of the formula")
+
+    def get_operand_polarity(self, frame):
+        """Returns polarity of the next operand of an unfinished operation, 0 if it is not known yet"""
+        operation, _, operands, polarity = frame
+        if operation == 'not':
+            return flip(polarity)
+        if operation in ['and', 'or'] or (operation == 'ite' and len(operands) > 0):
+            return polarity
+        if operation == '=>':
+            # only the last operand is not negated
+            return 0
+        return BOTH
+
+    def complete(self, operation, operands, polarity, var):
+        """Returns literal of a complete operation, yields clauses of its new nodes"""
+        if not MIN_OPERANDS[operation] <= len(operands) <= MAX_OPERANDS.get(operation, len(operands)):
+            raise Exception("Wrong number of operands of '" + operation + "'")
+
+        if operation == 'not':
+            return -operands[0]
+        if operation == '=>':
+            operation = 'or'
+            operands = [-o for o in operands[:-1]] + operands[-1:]
+        if operation in ['and', 'or', 'ite']:
+            return (yield from self.get_node(operation, operands, polarity, var))
+
+        if operation == 'xor':
+            # left associative chain of binary nodes, the inner ones are required by the outer ones
+            literal = operands[0]
+            for i in range(1, len(operands)):
+                last = i == len(operands) - 1
+                literal = yield from self.get_node('xor', [literal, operands[i]], polarity if last else 0,
+                                                   var if last else None)
+            return literal
+
+        # '=' is a negated 'xor' or a conjunction of such equivalences
+        if len(operands) == 2:
+            return -(yield from self.get_node('xor', operands, flip(polarity), var))
+        equivalences = []
+        for i in range(len(operands) - 1):
+            equivalences.append(-(yield from self.get_node('xor', operands[i:i + 2], 0)))
+        return (yield from self.get_node('and', equivalences, polarity, var))
+
+    def get_node(self, operation, operands, polarity, var=None):
+        """Returns variable of the node, yields its clauses required by the polarity"""
+        if operation in ['and', 'or']:
+            operands = sorted(set(operands))
+            if len(operands) == 1:
+                return operands[0]
+        key = (operation,) + tuple(operands)
+        if operation == 'xor':
+            key = (operation, min(operands), max(operands))
+
+        if self.hashing and key in self.nodes:
+            var = self.nodes[key]
         else:
-            if node.left.var != -node.right.var:            # avoiding 'True' clause
-                clauses_list.append([-node.left.var, -node.right.var, node.var])
+            if var is None:
+                var = new_auxiliary_variable(self.variables)
+            self.definitions[var] = key
+            self.emitted[var] = 0
+            if self.hashing:
+                self.nodes[key] = var
+        yield from self.require(var, polarity)
+        return var
 
-    extract_clauses(node.left, implications_only, clauses_list)
-    extract_clauses(node.right, implications_only, clauses_list)
+    def require(self, literal, polarity):
+        """Yields clauses of the node of the literal and of its operands needed for the polarity"""
+        requirements = [(literal, polarity)]
+        while len(requirements) > 0:
+            literal, polarity = requirements.pop()
+            var = abs(literal)
+            if literal < 0:
+                polarity = flip(polarity)
+            if var not in self.definitions:
+                continue
+            missing = polarity & ~self.emitted[var]
+            if missing == 0:
+                continue
+            self.emitted[var] |= missing
 
+            operation, *operands = self.definitions[var]
+            clauses = []
+            if operation == 'and':
+                if missing & POSITIVE:
+                    clauses.extend([-var, o] for o in operands)
+                if missing & NEGATIVE:
+                    clauses.append([var] + [-o for o in operands])
+                requirements.extend((o, missing) for o in operands)
+            elif operation == 'or':
+                if missing & POSITIVE:
+                    clauses.append([-var] + operands)
+                if missing & NEGATIVE:
+                    clauses.extend([var, -o] for o in operands)
+                requirements.extend((o, missing) for o in operands)
+            elif operation == 'xor':
+                a, b = operands
+                if missing & POSITIVE:
+                    clauses.extend([[-var, a, b], [-var, -a, -b]])
+                if missing & NEGATIVE:
+                    clauses.extend([[var, -a, b], [var, a, -b]])
+                requirements.extend([(a, BOTH), (b, BOTH)])
+            else:
+                c, t, e = operands
+                if missing & POSITIVE:
+                    clauses.extend([[-var, -c, t], [-var, c, e]])
+                if missing & NEGATIVE:
+                    clauses.extend([[var, -c, -t], [var, c, -e]])
+                requirements.extend([(c, BOTH), (t, missing), (e, missing)])
 
-def load_smtlib(input, implications_only=False):
+            # avoiding 'True' clauses and repeated literals of operands which are the same
+            if operation in ['xor', 'ite'] or len(set(abs(o) for o in operands)) < len(operands):
+                clauses = [list(dict.fromkeys(clause)) for clause in clauses if all(-l not in clause for l in clause)]
+            yield clauses
+
+
+def load_smtlib(input, implications_only=False, hashing=True):
+    """Returns Tseitin clauses, variables mapping and the literal of the whole formula (the root)"""
     variables = dict()
-    tokens = get_tokens(input)
-    root = load_formula(tokens, variables)
     clauses = []
-    extract_clauses(root, implications_only, clauses)
-    return clauses, variables
+    encoder = TseitinEncoder(variables, implications_only, hashing)
+    for node_clauses in encoder.encode(get_tokens(input)):
+        clauses.extend(node_clauses)
+    return clauses, variables, encoder.root
+
 
+class DimacsWriter:
+    """Buffered writer of DIMACS clauses whose numbers of variables and clauses are known only at the end
+
+    A fixed width header is patched by 'close' if the output is a seekable file, otherwise the clauses
+    are spooled to a temporary file which is copied to the output after the header.
+    """
+    HEADER_WIDTH = 48
+
+    def __init__(self, output, buffer_size=1 << 14):
+        self.output = output
+        self.buffer_size = buffer_size      # number of clauses joined into a single write
+        self.buffer = []
+        self.clauses_number = 0
+        # standard output may be a file opened for appending, where writes ignore seeking
+        self.seekable = output is not sys.stdout and 'a' not in getattr(output, 'mode', 'a') and output.seekable()
+        if self.seekable:
+            self.header_position = output.tell()
+            output.write(' ' * self.HEADER_WIDTH + '\n')
+            self.target = output
+        else:
+            self.target = tempfile.TemporaryFile('w+', encoding='UTF-8')
+
+    def add_clauses(self, clauses):
+        for clause in clauses:
+            self.buffer.append(' '.join(map(str, clause)))
+        self.clauses_number += len(clauses)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self.target.write(' 0\n'.join(self.buffer) + ' 0\n')
+            self.buffer.clear()
+
+    def close(self, variables_number):
+        """Writes the header, the output stays open"""
+        self.flush()
+        header = 'p cnf ' + str(variables_number) + ' ' + str(self.clauses_number)
+        if self.seekable:
+            end = self.output.tell()
+            self.output.seek(self.header_position)
+            self.output.write(header.ljust(self.HEADER_WIDTH))
+            self.output.seek(end)
+        else:
+            self.output.write(header + '\n')
+            self.target.seek(0)
+            shutil.copyfileobj(self.target, self.output)
+            self.target.close()
+
+
+def tseitin_encoding(input, output, implications_only=False, hashing=True):
+    """Writes the Tseitin encoding of the formula, variable mappings are commented at the end of the output"""
+    variables = dict()
+    encoder = TseitinEncoder(variables, implications_only, hashing)
+
+    print('c', file=output)
+    writer = DimacsWriter(output)
+    for node_clauses in encoder.encode(get_tokens(input)):
+        writer.add_clauses(node_clauses)
+    writer.close(len(variables))
 
-def tseitin_encoding(input, output, implications_only=False):
-    clauses, variables = load_smtlib(input, implications_only)
     original_variables_mapping = {}
     auxiliary_variables = []
     for k, v in variables.items():
@@ -102,14 +322,9 @@ def tseitin_encoding(input, output, implications_only=False):
     print('c', original_variables_mapping, file=output)
     print('c List of auxiliary variables:', file=output)
     print('c', auxiliary_variables, file=output)
-    print('c Variable corresponding to root node: 1', file=output)
-    print('c', file=output)
-    print('p cnf', len(variables), len(clauses), file=output)
-
-    for clause in clauses:
-        print(*clause, 0, file=output)
+    print('c Literal corresponding to root node:', encoder.root, file=output)
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    tseitin_encoding(args.infile, args.outfile, args.implications_only)
\ No newline at end of file
+    tseitin_encoding(args.infile, args.outfile, args.implications_only, not args.no_hashing)
@@ -1,41 +1,52 @@
+import sys
+import argparse
+import statistics
 import matplotlib.pyplot as plt
 
-'''ploot(number_of_variables[:5], dpll_CPU_time, 'dpll')
-ploot(number_of_variables, dpll_h_CPU_time, 'dpll with heuristics')
+from benchmark import load_results
 
-plt.yscale('log')
-plt.xlabel('number of variables')
-plt.ylabel('CPU time [s]')'''
+parser = argparse.ArgumentParser()
+parser.add_argument('results', help="JSON file written by 'benchmark.py run'")
+parser.add_argument('--metric', choices=['CPU time', 'decisions', 'unit propagation steps', 'checked clauses'],
+                    default='CPU time')
+parser.add_argument('--solvers', nargs='*', default=['dpll', 'dpll shortest', 'dpll MOMs', 'dpll_watched'],
+                    help="Names of plotted solvers")
+parser.add_argument('--families', nargs='*', default=['uf', 'uuf'], help="Plotted instance families")
+parser.add_argument('--output', default=None, help="Save the plot to a file instead of showing it")
 
-'''ploot(number_of_variables[:5], dpll_CPU_time, 'dpll - adjacency lists')
-ploot(number_of_variables[:5], dpll_w_CPU_time, 'dpll - watched literals')
 
-plt.yscale('log')
-plt.xlabel('number of variables')
-plt.ylabel('CPU time [s]')'''
-
-
-number_of_variables = [50, 75, 100, 125, 150, 175, 200]
-
-dpll_h_CPU_time = [0.01, 0.13, 1.86, 5.89, 62.81, 387.86, 2289.29]
-
-dpll_w_CPU_time = [0.07, 0.74, 13.64, 5.51, 2068.71]
-dpll_w_checked_clauses = [24717, 203287, 3224053, 1288421, 357288056]
-
-dpll_CPU_time = [0.09, 0.85, 25.36, 14.49, 3396.05]
-dpll_checked_clauses = [79206, 681634, 12040982, 4981417, 1438357866]
+def get_series(results, metric, families):
+    """Returns numbers of variables and medians of the metric over instances of the same size"""
+    values = dict()
+    for entry in results.values():
+        if entry['family'] in families and entry['timeouts'] == 0:
+            values.setdefault(entry['variables'], []).append(entry[metric])
+    number_of_variables = sorted(values)
+    return number_of_variables, [statistics.median(values[n]) for n in number_of_variables]
 
 
 def ploot(x, y, label):
     plt.plot(x, y, linestyle='--', marker='o', markersize=5, label=label)
 
-plt.figure()
 
-ploot(number_of_variables[:5], dpll_checked_clauses, 'dpll - adjacency lists')
-ploot(number_of_variables[:5], dpll_w_checked_clauses, 'dpll - watched literals')
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    data = load_results(args.results)
+
+    plt.figure()
+    for name in args.solvers:
+        if name not in data['results']:
+            print('No results of', name, file=sys.stderr)
+            continue
+        ploot(*get_series(data['results'][name], args.metric, args.families), name)
 
-plt.yscale('log')
-plt.xlabel('number of variables')
-plt.ylabel('number of checked clauses')
-plt.legend()
-plt.show()
+    plt.yscale('log')
+    plt.xlabel('number of variables')
+    plt.ylabel(args.metric + (' [s]' if args.metric == 'CPU time' else ''))
+    plt.title('revision ' + str(data['revision'])[:8])
+    plt.legend()
+    if args.output is None:
+        plt.show()
+    else:
+        plt.savefig(args.output)
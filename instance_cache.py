@@ -0,0 +1,147 @@
+import sys
+import os
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+import tempfile
+from array import array
+
+from formula2cnf import load_smtlib, ENCODING_VERSION
+from dimacs import load_dimacs, paused_garbage_collection
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'sat_solvers')
+DEFAULT_MAX_SIZE = 1 << 30      # bytes
+
+# magic, variables, clauses, literals, root literal (0 for DIMACS inputs),
+# length of the JSON encoded variables mapping (-1 for DIMACS inputs)
+HEADER = struct.Struct('=8sqqqqq')
+MAGIC = b'SATCNF02'
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR)
+parser.add_argument('--clear', action='store_true', help="Delete all cached instances")
+
+
+def get_cache_key(file_name, file_suffix):
+    """Returns hash of the file content, None if the input is not a regular file"""
+    if not os.path.isfile(file_name):
+        return None
+    content_hash = hashlib.blake2b(digest_size=20)
+    content_hash.update(file_suffix.encode())
+    if file_suffix == 'sat':
+        # cached clauses of a formula depend on its encoding
+        content_hash.update(str(ENCODING_VERSION).encode())
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+
+def write_instance(path, clauses, variables_mapping, root):
+    """Writes flat literal array with clause offsets, the file is replaced atomically"""
+    offsets = array('q', [0])
+    literals = array('i')
+    for clause in clauses:
+        literals.extend(clause)
+        offsets.append(len(literals))
+    variables_number = max(max(literals, default=0), -min(literals, default=0))
+    mapping = b'' if variables_mapping is None else json.dumps(variables_mapping).encode()
+
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, variables_number, len(clauses), len(literals), root or 0,
+                            -1 if variables_mapping is None else len(mapping)))
+        offsets.tofile(f)
+        literals.tofile(f)
+        f.write(mapping)
+    os.replace(tmp_path, path)
+
+
+def read_instance(path):
+    """Returns clauses, variables mapping and root literal (both None for DIMACS inputs) of a cached instance"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, variables_number, clauses_number, literals_number, root, mapping_length = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a cached instance: " + path)
+
+        offsets_start = HEADER.size
+        literals_start = offsets_start + 8 * (clauses_number + 1)
+        mapping_start = literals_start + 4 * literals_number
+        with memoryview(mm) as view:
+            with view[offsets_start:literals_start].cast('q') as offsets_view:
+                offsets = offsets_view.tolist()
+            with view[literals_start:mapping_start].cast('i') as literals_view:
+                literals = literals_view.tolist()
+        variables_mapping = None
+        if mapping_length >= 0:
+            variables_mapping = json.loads(mm[mapping_start:mapping_start + mapping_length])
+
+    with paused_garbage_collection():
+        clauses = [literals[offsets[i]:offsets[i + 1]] for i in range(clauses_number)]
+    return clauses, variables_mapping, root or None
+
+
+def evict(cache_dir, max_size):
+    """Deletes least recently used instances until the cache fits into 'max_size' bytes"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.bin'):
+            path = os.path.join(cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        os.remove(path)
+        total_size -= size
+
+
+def load_instance(input, file_suffix, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+    """Returns clauses, variables mapping and literal of the whole formula (both None for DIMACS inputs)
+
+    The root literal of .sat inputs is not added to the clauses as a unit. Parsed instances are cached in 'cache_dir',
+    caching is turned off when 'cache_dir' is None or the input is not a regular file.
+    """
+    key = None if cache_dir is None else get_cache_key(input.name, file_suffix)
+    if key is not None:
+        path = os.path.join(cache_dir, key + '.bin')
+        if os.path.isfile(path):
+            try:
+                result = read_instance(path)
+                os.utime(path)      # the modification time orders entries for eviction
+                return result
+            except (ValueError, OSError, struct.error):
+                os.remove(path)
+
+    if file_suffix == 'sat':
+        clauses, variables_mapping, root = load_smtlib(input)
+    else:
+        clauses, variables_mapping, root = load_dimacs(input), None, None
+
+    if key is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            write_instance(path, clauses, variables_mapping, root)
+            evict(cache_dir, max_size)
+        except OSError:
+            pass        # solving does not depend on the cache
+    return clauses, variables_mapping, root
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        print('Cache directory does not exist')
+        sys.exit()
+
+    if args.clear:
+        evict(args.cache_dir, 0)
+    entries = [name for name in os.listdir(args.cache_dir) if name.endswith('.bin')]
+    size = sum(os.path.getsize(os.path.join(args.cache_dir, name)) for name in entries)
+    print('cached instances:', len(entries))
+    print('cache size:', "{:.1f} kB".format(size / 1024))
@@ -0,0 +1,131 @@
+import sys
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PHASES = ['parse', 'preprocess', 'init', 'search', 'propagate', 'analyze', 'restart', 'reduce']
+
+
+def add_instrumentation_arguments(parser, conflicts=True):
+    """Adds statistics options to the command line parser of a solver, 'conflicts' if it learns clauses"""
+    parser.add_argument('--stats', default=None, help="Write detailed statistics as JSON to the file ('-' for stdout)")
+    if conflicts:
+        parser.add_argument('--stats_interval', type=int, default=0,
+                            help="Print statistics to stderr every N conflicts (0 for never)")
+
+
+class Instrumentation:
+    """Phase timers and histograms of a solver run
+
+    Solvers are instrumented by replacing their phase methods (or module functions) by timed wrappers,
+    so a solver without instrumentation runs its original code. Phase times are exclusive, e.g. the time
+    of clause deletion during a restart is counted as 'reduce' only and 'search' is the rest of the search.
+    """
+    def __init__(self, callback=None, interval=1000):
+        self.callback = callback            # called with the statistics every 'interval' conflicts
+        self.interval = interval
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.phase = None                   # phase which is being measured
+        self.learned_sizes = Counter()
+        self.learned_lbd = Counter()
+        self.learned_counter = 0
+        self.solver = None
+
+    def start(self, phase):
+        outer = self.phase
+        self.phase = phase
+        return outer, time.perf_counter()
+
+    def stop(self, phase, outer, start):
+        elapsed = time.perf_counter() - start
+        self.phase_times[phase] += elapsed
+        if outer is not None:
+            self.phase_times[outer] -= elapsed
+        self.phase = outer
+
+    @contextmanager
+    def measure(self, phase):
+        outer, start = self.start(phase)
+        try:
+            yield
+        finally:
+            self.stop(phase, outer, start)
+
+    def timed(self, phase, function):
+        """Returns the function wrapped by a timer of the phase"""
+        def timed_function(*args, **kwargs):
+            outer, start = self.start(phase)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stop(phase, outer, start)
+        return timed_function
+
+    def attach_cdcl(self, solver):
+        """Instruments phase methods and learning of a CDCL_solver instance"""
+        self.solver = solver
+        solver.unit_propagation = self.timed('propagate', solver.unit_propagation)
+        solver.conflict_analysis = self.timed('analyze', solver.conflict_analysis)
+        solver.restart = self.timed('restart', solver.restart)
+        solver.select_deleted_clauses = self.timed('reduce', solver.select_deleted_clauses)
+        solver.reduce_clause_database = self.timed('reduce', solver.reduce_clause_database)
+
+        join_learned_clause = solver.join_learned_clause
+
+        def counted_join_learned_clause(clause, unit_literal, lbd):
+            join_learned_clause(clause, unit_literal, lbd)
+            self.learned_sizes[len(clause)] += 1
+            self.learned_lbd[lbd] += 1
+            self.learned_counter += 1
+            if self.callback is not None and self.learned_counter % self.interval == 0:
+                self.callback(self.get_statistics())
+        solver.join_learned_clause = counted_join_learned_clause
+
+    def attach_dpll(self, module):
+        """Instruments unit propagation of the dpll or dpll_watched module"""
+        self.solver = module
+        module.unit_prop = self.timed('propagate', module.unit_prop)
+
+    def get_statistics(self):
+        """Returns a dictionary with statistics of the instrumented solver, it can be called during solving"""
+        solver = self.solver
+        statistics = {'phase times': dict(self.phase_times)}
+        propagation_time = self.phase_times['propagate']
+        statistics['decisions'] = solver.decisions_counter
+        statistics['unit propagation steps'] = solver.unit_prop_counter
+        statistics['checked clauses'] = solver.checked_clauses_counter
+        statistics['propagations per second'] = solver.unit_prop_counter / propagation_time if propagation_time > 0 else 0
+
+        if hasattr(solver, 'conflicts_total'):
+            statistics['conflicts'] = solver.conflicts_total
+            statistics['restarts'] = solver.restarts_counter
+            if solver.restart_type == 'glucose':
+                statistics['blocked restarts'] = solver.glucose.blocked_restarts_counter
+            statistics['reductions'] = solver.reductions_counter
+            statistics['learned clause sizes'] = dict(sorted(self.learned_sizes.items()))
+            statistics['learned clause LBD'] = dict(sorted(self.learned_lbd.items()))
+            learned_clauses_counts = solver.get_learned_clauses_counts()
+            statistics['clause database'] = {
+                'clauses': len(solver.clauses) - len(solver.free_indices),
+                'learned clauses': sum(learned_clauses_counts.values()),
+                'learned clauses per tier': learned_clauses_counts,
+                'memory': solver.get_memory_usage(),
+            }
+        return statistics
+
+
+def print_progress(statistics):
+    """Callback printing a one line summary of the running solver to stderr"""
+    print('conflicts: {}, restarts: {}, learned clauses: {}, propagations/s: {:.0f}'.format(
+        statistics['conflicts'], statistics['restarts'], statistics['clause database']['learned clauses'],
+        statistics['propagations per second']), file=sys.stderr, flush=True)
+
+
+def write_statistics(statistics, file_name):
+    if file_name == '-':
+        json.dump(statistics, sys.stdout, indent=1)
+        print()
+    else:
+        with open(file_name, 'w', encoding='UTF-8') as f:
+            json.dump(statistics, f, indent=1)
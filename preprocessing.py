@@ -0,0 +1,211 @@
+import sys
+import argparse
+import time
+
+from dimacs import open_input, load_dimacs
+
+parser = argparse.ArgumentParser()
+parser.add_argument('infile', nargs='?', type=open_input, default=sys.stdin)
+parser.add_argument('outfile', nargs='?', type=argparse.FileType('w', encoding='UTF-8'), default=sys.stdout)
+parser.add_argument('--time_limit', type=float, default=10, help="Maximal preprocessing time in seconds")
+parser.add_argument('--growth', type=int, default=0, help="Number of clauses an elimination may add")
+
+
+def add_preprocessing_arguments(parser):
+    """Adds preprocessing options to the command line parser of a solver"""
+    parser.add_argument('--preprocess', action='store_true', help="Simplify the formula before search")
+    parser.add_argument('--preprocess_time', type=float, default=10, help="Maximal preprocessing time in seconds")
+    parser.add_argument('--preprocess_growth', type=int, default=0, help="Number of clauses an elimination may add")
+
+
+class Preprocessor:
+    """Subsumption, self-subsuming resolution and bounded variable elimination with model reconstruction"""
+    def __init__(self, clauses, time_limit=10, growth_limit=0, frozen=()):
+        self.start = time.time()
+        self.deadline = self.start + time_limit
+        self.growth_limit = growth_limit        # number of clauses an elimination may add
+        self.frozen = set(abs(l) for l in frozen)   # variables which must not be eliminated
+        self.occurrences_limit = 16             # variables occurring more often in both polarities are not eliminated
+        self.resolvent_length_limit = 20
+
+        self.clauses = []                   # sets of literals, None for removed clauses
+        self.occurrences = dict()           # mapping from literals to indices of clauses containing them
+        self.queue = []                     # indices of clauses to be used for subsumption
+        self.reconstruction_stack = []      # removed clauses together with the literal of eliminated variable
+        self.original_variables = set()
+        self.unsat = False
+
+        self.subsumed_counter = 0
+        self.strengthened_counter = 0
+        self.eliminated_counter = 0
+
+        for clause in clauses:
+            self.original_variables.update(abs(l) for l in clause)
+            self.add_clause(set(clause))
+        self.run()
+
+    def add_clause(self, clause):
+        if any(-l in clause for l in clause):
+            return      # 'True' clause
+        if len(clause) == 0:
+            self.unsat = True
+            return
+        clause_index = len(self.clauses)
+        self.clauses.append(clause)
+        for l in clause:
+            if l not in self.occurrences:
+                self.occurrences[l] = set()
+                self.occurrences[-l] = set()
+            self.occurrences[l].add(clause_index)
+        self.queue.append(clause_index)
+
+    def remove_clause(self, clause_index):
+        for l in self.clauses[clause_index]:
+            self.occurrences[l].discard(clause_index)
+        self.clauses[clause_index] = None
+
+    def strengthen_clause(self, clause_index, literal):
+        """Removes the literal from the clause"""
+        self.strengthened_counter += 1
+        self.clauses[clause_index].discard(literal)
+        self.occurrences[literal].discard(clause_index)
+        if len(self.clauses[clause_index]) == 0:
+            self.unsat = True
+        self.queue.append(clause_index)
+
+    def is_subsumed(self, clause):
+        """Forward subsumption, returns True if a stored clause is a subset of the clause"""
+        if len(clause) == 0:
+            return False
+        literal = min(clause, key=lambda l: len(self.occurrences.get(l, ())))
+        for j in self.occurrences.get(literal, ()):
+            if len(self.clauses[j]) <= len(clause) and self.clauses[j] <= clause:
+                return True
+        return False
+
+    def backward_subsumption(self, clause_index):
+        """Removes clauses subsumed by the clause and strengthens clauses by self-subsuming resolution"""
+        clause = self.clauses[clause_index]
+        best = min(clause, key=lambda l: len(self.occurrences[l]) + len(self.occurrences[-l]))
+        for j in list(self.occurrences[best]) + list(self.occurrences[-best]):
+            other = self.clauses[j]
+            if j == clause_index or other is None or len(other) < len(clause):
+                continue
+            flipped_literal = None
+            for l in clause:
+                if l in other:
+                    continue
+                if flipped_literal is None and -l in other:
+                    flipped_literal = l
+                else:
+                    break
+            else:
+                if flipped_literal is None:
+                    self.subsumed_counter += 1
+                    self.remove_clause(j)
+                else:
+                    self.strengthen_clause(j, -flipped_literal)
+                    if self.unsat:
+                        return
+
+    def subsumption(self):
+        # shorter clauses subsume more clauses, so they are processed first
+        while len(self.queue) > 0 and not self.unsat and time.time() < self.deadline:
+            self.queue.sort(key=lambda i: -len(self.clauses[i]) if self.clauses[i] is not None else 0)
+            queue, self.queue = self.queue, []
+            while len(queue) > 0 and not self.unsat:
+                clause_index = queue.pop()
+                if self.clauses[clause_index] is not None:
+                    self.backward_subsumption(clause_index)
+
+    def try_to_eliminate(self, var):
+        """Replaces clauses containing the variable by their resolvents if there are not too many of them"""
+        positive = list(self.occurrences[var])
+        negative = list(self.occurrences[-var])
+        if len(positive) + len(negative) == 0:
+            return False
+        if len(positive) > self.occurrences_limit and len(negative) > self.occurrences_limit:
+            return False
+
+        resolvents = []
+        bound = len(positive) + len(negative) + self.growth_limit
+        for i in positive:
+            for j in negative:
+                if any(-l in self.clauses[j] for l in self.clauses[i] if l != var):
+                    continue    # 'True' resolvent
+                resolvent = (self.clauses[i] | self.clauses[j]) - {var, -var}
+                if len(resolvent) > self.resolvent_length_limit:
+                    return False
+                resolvents.append(resolvent)
+                if len(resolvents) > bound:
+                    return False
+
+        for i in positive:
+            self.reconstruction_stack.append((var, list(self.clauses[i])))
+            self.remove_clause(i)
+        for j in negative:
+            self.reconstruction_stack.append((-var, list(self.clauses[j])))
+            self.remove_clause(j)
+        for resolvent in resolvents:
+            if not self.is_subsumed(resolvent):
+                self.add_clause(resolvent)
+        self.eliminated_counter += 1
+        return True
+
+    def variable_elimination(self):
+        candidates = [l for l in self.occurrences if l > 0 and l not in self.frozen]
+        candidates.sort(key=lambda v: len(self.occurrences[v]) * len(self.occurrences[-v]))
+        for var in candidates:
+            if self.unsat or time.time() >= self.deadline:
+                break
+            if self.try_to_eliminate(var):
+                self.subsumption()
+
+    def run(self):
+        self.subsumption()
+        self.variable_elimination()
+        self.time = time.time() - self.start
+
+    def get_clauses(self):
+        """Returns the simplified formula"""
+        if self.unsat:
+            # an empty clause is represented by complementary unit clauses, which every solver refutes
+            return [[1], [-1]]
+        return [sorted(clause, key=abs) for clause in self.clauses if clause is not None]
+
+    def extend_model(self, assignment):
+        """Returns the assignment of the simplified formula extended to all original variables"""
+        values = set(assignment)
+        for var in self.original_variables:
+            if var not in values and -var not in values:
+                values.add(-var)
+
+        for literal, clause in reversed(self.reconstruction_stack):
+            if not any(l in values for l in clause):
+                values.discard(-literal)
+                values.add(literal)
+        return list(values)
+
+    def get_statistics(self):
+        return {
+            'preprocessing time': self.time,
+            'subsumed clauses': self.subsumed_counter,
+            'strengthened clauses': self.strengthened_counter,
+            'eliminated variables': self.eliminated_counter,
+        }
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    clauses = load_dimacs(args.infile)
+    preprocessor = Preprocessor(clauses, args.time_limit, args.growth)
+    simplified_clauses = preprocessor.get_clauses()
+
+    print('c', file=args.outfile)
+    for name, value in preprocessor.get_statistics().items():
+        print('c', name + ':', value, file=args.outfile)
+    print('c', file=args.outfile)
+    print('p cnf', max(preprocessor.original_variables, default=0), len(simplified_clauses), file=args.outfile)
+    for clause in simplified_clauses:
+        print(*clause, 0, file=args.outfile)
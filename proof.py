@@ -0,0 +1,413 @@
+import sys
+import argparse
+import threading
+import queue
+import time
+import gzip
+import bz2
+import lzma
+
+from dimacs import open_input, load_dimacs
+
+PROOF_FORMATS = ['binary', 'text']
+
+# the proof is compressed while solving, so fast compression levels are used
+PROOF_OPENERS = {
+    'gz': lambda file_name, mode: gzip.open(file_name, mode, compresslevel=1),
+    'bz2': lambda file_name, mode: bz2.open(file_name, mode, compresslevel=1),
+    'xz': lambda file_name, mode: lzma.open(file_name, mode, preset=0) if 'w' in mode else lzma.open(file_name, mode),
+}
+
+parser = argparse.ArgumentParser()
+parser.add_argument('formula', type=open_input, help="DIMACS file with the original clauses")
+parser.add_argument('proof', help="DRAT proof in text or binary format, possibly compressed")
+parser.add_argument('--trim', default=None, help="Write the verified proof reduced to lemmas needed for the refutation")
+parser.add_argument('--trim_format', choices=PROOF_FORMATS, default='text')
+
+
+def open_proof(file_name, mode):
+    """Opens a plain or compressed proof file in binary mode"""
+    suffix = file_name.split('.')[-1]
+    if suffix in PROOF_OPENERS:
+        return PROOF_OPENERS[suffix](file_name, mode)
+    return open(file_name, mode)
+
+
+def add_proof_arguments(parser):
+    """Adds proof logging options to the command line parser of a solver"""
+    parser.add_argument('--proof', default=None,
+                        help="Write a DRAT proof of UNSAT answers to the file (compressed for .gz, .bz2 and .xz)")
+    parser.add_argument('--proof_format', choices=PROOF_FORMATS, default='binary')
+    parser.add_argument('--proof_thread', action='store_true', help="Write and compress the proof in a background thread")
+
+
+class ProofWriter:
+    """Buffered writer of a DRAT proof
+
+    Added and deleted clauses are encoded into a large buffer which is written when it is full. With
+    'background' the full buffers are handed to a thread which writes (and compresses) them, so
+    the solver only pays for the encoding. In the binary format a literal l is written as a varint
+    of 2 * |l| + (l < 0), 7 bits per byte with the highest bit marking continuation.
+    """
+    def __init__(self, file_name, binary=True, buffer_size=1 << 20, background=False):
+        self.file = open_proof(file_name, 'wb')
+        self.binary = binary
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.lines = []                     # text lines not encoded into the buffer yet
+        self.text_size = 0
+        self.added_counter = 0
+        self.deleted_counter = 0
+        self.thread = None
+        self.error = None
+        if background:
+            # a few buffers in flight bound the memory if the disk is slower than the solver
+            self.buffers = queue.Queue(maxsize=4)
+            self.thread = threading.Thread(target=self.write_buffers, daemon=True)
+            self.thread.start()
+
+    def write_buffers(self):
+        for buffer in iter(self.buffers.get, None):
+            if self.error is None:
+                try:
+                    self.file.write(buffer)
+                except Exception as e:
+                    self.error = e
+
+    def encode_binary(self, clause):
+        buffer = self.buffer
+        for l in clause:
+            u = 2 * l if l > 0 else 1 - 2 * l
+            while u > 127:
+                buffer.append(0x80 | (u & 0x7f))
+                u >>= 7
+            buffer.append(u)
+        buffer.append(0)
+
+    def add_clause(self, clause):
+        self.added_counter += 1
+        if self.binary:
+            self.buffer.append(0x61)        # 'a'
+            self.encode_binary(clause)
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+        else:
+            line = ' '.join(map(str, clause)) + ' 0\n' if len(clause) > 0 else '0\n'
+            self.lines.append(line)
+            self.text_size += len(line)
+            if self.text_size >= self.buffer_size:
+                self.flush()
+
+    def delete_clause(self, clause):
+        self.deleted_counter += 1
+        if self.binary:
+            self.buffer.append(0x64)        # 'd'
+            self.encode_binary(clause)
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+        else:
+            line = 'd ' + ' '.join(map(str, clause)) + ' 0\n'
+            self.lines.append(line)
+            self.text_size += len(line)
+            if self.text_size >= self.buffer_size:
+                self.flush()
+
+    def flush(self):
+        if len(self.lines) > 0:
+            self.buffer += ''.join(self.lines).encode()
+            self.lines = []
+            self.text_size = 0
+        if len(self.buffer) == 0:
+            return
+        if self.thread is not None:
+            self.buffers.put(self.buffer)
+            self.buffer = bytearray()
+        else:
+            self.file.write(self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self.thread is not None:
+            self.buffers.put(None)
+            self.thread.join()
+            self.thread = None
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def get_statistics(self):
+        return {'proof added clauses': self.added_counter, 'proof deleted clauses': self.deleted_counter}
+
+
+def is_binary_proof(data):
+    """Guesses the proof format from its beginning, text proofs contain only digits, '-', 'd' and whitespace"""
+    return any(byte not in b'0123456789-d \t\r\n' for byte in data[:10])
+
+
+def read_proof(file_name):
+    """Returns list of proof steps (True for addition, False for deletion, clause)"""
+    with open_proof(file_name, 'rb') as f:
+        data = f.read()
+
+    steps = []
+    if is_binary_proof(data):
+        i = 0
+        while i < len(data):
+            step = data[i]
+            if step not in b'ad':
+                raise ValueError("Wrong binary proof step at byte " + str(i))
+            i += 1
+            clause = []
+            u = 0
+            shift = 0
+            while True:
+                byte = data[i]
+                i += 1
+                u |= (byte & 0x7f) << shift
+                if byte & 0x80:
+                    shift += 7
+                    continue
+                if u == 0:
+                    break
+                clause.append(u >> 1 if u & 1 == 0 else -(u >> 1))
+                u = 0
+                shift = 0
+            steps.append((step == 0x61, clause))
+        return steps
+
+    for line in data.decode().splitlines():
+        tokens = line.split()
+        if len(tokens) == 0 or tokens[0] == 'c':
+            continue
+        addition = tokens[0] != 'd'
+        literals = list(map(int, tokens if addition else tokens[1:]))
+        if len(literals) == 0 or literals[-1] != 0:
+            raise ValueError("Proof line not terminated by 0: " + line)
+        steps.append((addition, literals[:-1]))
+    return steps
+
+
+class ProofChecker:
+    """Forward DRAT checker, every lemma has to be RUP or RAT on its first literal
+
+    Unit propagation uses two watched literals at positions 0 and 1 of the clauses. Literals implied
+    at the top level are kept, a lemma is checked by assigning its negation, propagating to a conflict
+    and undoing the assignment. Conflict analysis of every check records the clauses it used, so the
+    lemmas needed for the refutation can be found backwards from the empty clause (trimming).
+    Deletions of clauses which are reasons of top level literals are ignored, as in drat-trim.
+    """
+    def __init__(self, clauses):
+        self.clauses = []           # clauses by id, None for deleted ones
+        self.lemmas = []            # (clause id, clause, antecedent clause ids) of checked lemmas
+        self.watches = dict()
+        self.values = dict()        # literal -> True for assigned literals
+        self.reasons = dict()       # variable -> clause id implying it
+        self.trail = []
+        self.head = 0               # position in the trail of the next literal to propagate
+        self.ids = dict()           # sorted clause -> ids of active copies, used by deletions
+        self.conflict = None        # id of a clause falsified at the top level
+        self.original_number = len(clauses)
+        self.ignored_deletions_counter = 0
+        for clause in clauses:
+            self.add_clause(clause)
+
+    def value(self, literal):
+        if literal in self.values:
+            return 1
+        if -literal in self.values:
+            return -1
+        return 0
+
+    def assign(self, literal, reason):
+        self.values[literal] = True
+        self.reasons[abs(literal)] = reason
+        self.trail.append(literal)
+
+    def add_clause(self, clause):
+        """Adds a clause at the top level, returns its id"""
+        clause = list(dict.fromkeys(clause))
+        clause_id = len(self.clauses)
+        self.clauses.append(clause)
+        self.ids.setdefault(tuple(sorted(clause)), []).append(clause_id)
+        if self.conflict is not None or any(-l in clause for l in clause):
+            return clause_id
+
+        # non-falsified literals are watched
+        clause.sort(key=lambda l: self.value(l) < 0)
+        for l in clause[:2]:
+            self.watches.setdefault(l, []).append(clause_id)
+        if len(clause) == 0 or self.value(clause[0]) < 0:
+            self.conflict = clause_id
+        elif (len(clause) == 1 or self.value(clause[1]) < 0) and self.value(clause[0]) == 0:
+            self.assign(clause[0], clause_id)
+            self.conflict = self.propagate()
+        return clause_id
+
+    def delete_clause(self, clause):
+        ids = self.ids.get(tuple(sorted(set(clause))))
+        if not ids:
+            raise ValueError("Deleted clause not found: " + str(clause))
+        clause_id = ids[-1]
+        if any(self.reasons.get(abs(l)) == clause_id for l in self.clauses[clause_id] if self.value(l) > 0):
+            self.ignored_deletions_counter += 1
+            return
+        ids.pop()
+        for l in self.clauses[clause_id][:2]:
+            if clause_id in self.watches.get(l, []):
+                self.watches[l].remove(clause_id)
+        self.clauses[clause_id] = None
+
+    def propagate(self):
+        """Returns id of a falsified clause or None"""
+        while self.head < len(self.trail):
+            false_literal = -self.trail[self.head]
+            self.head += 1
+            watches = self.watches.get(false_literal, [])
+            kept = []
+            conflict = None
+            for i, clause_id in enumerate(watches):
+                clause = self.clauses[clause_id]
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], clause[0]
+                if self.value(clause[0]) > 0:
+                    kept.append(clause_id)
+                    continue
+                for k in range(2, len(clause)):
+                    if self.value(clause[k]) >= 0:
+                        clause[1], clause[k] = clause[k], clause[1]
+                        self.watches.setdefault(clause[1], []).append(clause_id)
+                        break
+                else:
+                    kept.append(clause_id)
+                    if self.value(clause[0]) < 0:
+                        conflict = clause_id
+                        kept.extend(watches[i + 1:])
+                        break
+                    self.assign(clause[0], clause_id)
+            self.watches[false_literal] = kept
+            if conflict is not None:
+                return conflict
+        return None
+
+    def backtrack(self, trail_size):
+        while len(self.trail) > trail_size:
+            literal = self.trail.pop()
+            del self.values[literal]
+            del self.reasons[abs(literal)]
+        self.head = trail_size
+
+    def get_antecedents(self, clause_id, skipped_var=None):
+        """Returns ids of the clause and of reasons of its falsified literals, transitively through the trail"""
+        antecedents = [clause_id]
+        marked = set(abs(l) for l in self.clauses[clause_id])
+        marked.discard(skipped_var)
+        for i in range(len(self.trail) - 1, -1, -1):
+            var = abs(self.trail[i])
+            if var in marked:
+                reason = self.reasons[var]
+                # the negated literals of a checked lemma have no reasons
+                if reason is not None:
+                    antecedents.append(reason)
+                    marked.update(abs(l) for l in self.clauses[reason])
+        return antecedents
+
+    def is_rup(self, clause):
+        """Returns antecedents if the clause is implied by unit propagation, None otherwise"""
+        if self.conflict is not None:
+            return self.get_antecedents(self.conflict)
+        trail_size = len(self.trail)
+        for l in clause:
+            value = self.value(l)
+            if value > 0:
+                # satisfied at the top level
+                return self.get_antecedents(self.reasons[abs(l)], abs(l))
+            if value == 0:
+                self.assign(-l, None)
+        conflict = self.propagate()
+        antecedents = None if conflict is None else self.get_antecedents(conflict)
+        self.backtrack(trail_size)
+        return antecedents
+
+    def is_rat(self, clause):
+        """Returns antecedents if the clause is a resolution asymmetric tautology on its first literal"""
+        if len(clause) == 0:
+            return None
+        pivot = clause[0]
+        antecedents = []
+        for clause_id, other in enumerate(self.clauses):
+            if other is None or -pivot not in other:
+                continue
+            resolvent = clause + [l for l in other if l != -pivot]
+            if any(-l in resolvent for l in resolvent):
+                continue
+            resolvent_antecedents = self.is_rup(resolvent)
+            if resolvent_antecedents is None:
+                return None
+            antecedents.append(clause_id)
+            antecedents.extend(resolvent_antecedents)
+        return antecedents
+
+    def check(self, steps):
+        """Checks the proof steps, returns True if the formula is refuted"""
+        for addition, clause in steps:
+            if not addition:
+                self.delete_clause(clause)
+                continue
+            antecedents = self.is_rup(clause)
+            if antecedents is None:
+                antecedents = self.is_rat(clause)
+            if antecedents is None:
+                raise ValueError("Lemma " + str(len(self.lemmas) + 1) + " is neither RUP nor RAT: " + str(clause))
+            clause_id = self.add_clause(clause)
+            self.lemmas.append((clause_id, list(clause), antecedents))
+            if len(clause) == 0:
+                return True
+        return self.conflict is not None
+
+    def get_core_lemmas(self):
+        """Returns lemmas needed for the refutation, in the order of the proof"""
+        needed = set()
+        if self.conflict is not None:
+            needed.update(self.get_antecedents(self.conflict))
+        core = []
+        for clause_id, clause, antecedents in reversed(self.lemmas):
+            if clause_id in needed:
+                core.append(clause)
+                needed.update(antecedents)
+        return core[::-1]
+
+
+def write_trimmed_proof(core, file_name, binary):
+    writer = ProofWriter(file_name, binary)
+    for clause in core:
+        writer.add_clause(clause)
+    writer.close()
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    start = time.time()
+    clauses = load_dimacs(args.formula)
+    steps = read_proof(args.proof)
+    checker = ProofChecker(clauses)
+    try:
+        verified = checker.check(steps)
+    except ValueError as e:
+        print('NOT VERIFIED:', e)
+        sys.exit(1)
+    if not verified:
+        print('NOT VERIFIED: the proof does not derive the empty clause')
+        sys.exit(1)
+    print('VERIFIED')
+
+    core = checker.get_core_lemmas()
+    print('proof steps:', len(steps))
+    print('lemmas:', len(checker.lemmas))
+    print('core lemmas:', len(core))
+    print('ignored deletions of reasons:', checker.ignored_deletions_counter)
+    if args.trim is not None:
+        write_trimmed_proof(core, args.trim, args.trim_format == 'binary')
+        print('trimmed proof written to', args.trim)
+    print('checking time:', "{:.2f}".format(time.time() - start))